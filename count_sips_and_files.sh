@@ -8,7 +8,7 @@
 # Redirect the output to a CSV file, or pipe it to "column -s ',' -t".
 
 
-printf "SET, DC:DATE, SIZE, SIPs, SIP FILES, DIFF MD5s, DCTERMS:ISSN, DC:PUBLISHER\n"
+printf "SET, DC:DATE, SIZE, SIPs, SIP FILES, DIFF CHECKSUMS, DCTERMS:ISSN, DC:PUBLISHER\n"
 
 for set_folder in *HINDAWI*/
 do
@@ -17,10 +17,13 @@ do
   dc_publisher=$(find $set_folder -name "dc.xml" -exec grep "dc:publisher" {} \; | sort -u | sed -e 's/ *<[^>]*>//g' | tr '\n' ' ')
   dc_issn=$(find $set_folder -name "dc.xml" -exec grep "dcterms:ISSN" {} \; | sort -u | sed -e 's/ *<[^>]*>//g' | tr '\n' ' ')
   size=$(du -s -BM  $set_folder | cut -f1)
-  sip_folders=$(find $set_folder -mindepth 1 -maxdepth 1 -type d | wc -l)
-  sip_files=$(find $set_folder -type f -path "*MASTER*" ! -name "*.md5"| wc -l)
+  # SIP folders are direct children of the set folder or sit in shard folders (--layout hash|doiprefix)
+  sip_folders=$(find $set_folder -mindepth 2 -maxdepth 3 -type f -name "oai-record.xml" | wc -l)
+  sip_files=$(find $set_folder -type f -path "*MASTER*" ! -name "*.md5" ! -name "*.sha*"| wc -l)
+  # checksums are in manifest.tsv files (one line per file after the header) or in md5 sidecar files
   md5_files=$(find $set_folder -type f -path "*MASTER*" -name "*.md5"| wc -l)
-  diff_sip_md5=$(expr $sip_files - $md5_files)
+  manifest_lines=$(find $set_folder -maxdepth 3 -type f -name "manifest.tsv" ! -path "*/MASTER/*" -exec tail -n +2 {} \; | wc -l)
+  diff_sip_md5=$(expr $sip_files - $md5_files - $manifest_lines)
 
   printf "$hindawi_set, $dc_date, $size, $sip_folders, $sip_files, $diff_sip_md5, $dc_issn, $dc_publisher\n"
 done
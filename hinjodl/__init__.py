@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# TIB-LZA Journal Downloader Hindawi (HinJoDL) as a package.
+#
+# Importing the package has no side effects and loads nothing heavy, the
+# harvester is only imported when it is accessed:
+#
+#   from hinjodl import Harvester
+#   from hinjodl.cli import build_parser
+#
+#   options = build_parser().parse_args(['HINDAWI.JPOL:2016', '--workers', '8'])
+#   harvester = Harvester(options)
+#   try:
+#       harvester.run()
+#   finally:
+#       harvester.close()
+#
+# The command line interface is 'hinjodl' (after installation) or
+# 'python3 -m hinjodl', the old 'hindawi-downloader.py' still works.
+
+
+__all__ = ['Harvester', 'HarvesterError', 'get_version']
+
+
+def __getattr__(name):
+    if name in ('Harvester', 'HarvesterError'):
+        from hinjodl import harvester
+        return getattr(harvester, name)
+    if name == 'get_version':
+        from hinjodl.version import get_version
+        return get_version
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+
+import sys
+from hinjodl.cli import main
+
+
+sys.exit(main())
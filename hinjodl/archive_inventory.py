@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Inventory of the records that are already downloaded or ingested.
+#
+# SIPs move from the download folder to the folder of ingested SIPs (see
+# 'progress_metrics.sh'). The downloader itself does not know about that, so a
+# rerun would fetch records again that are already in the archive. This
+# module keeps an index of both trees in an SQLite file, keyed by the OAI
+# identifier in the 'objectIdentifier' of each 'harvest.xml'.
+#
+# Both trees have the layout <root>/<set folder>/<SIP folder>/harvest.xml,
+# or <root>/<set folder>/<shard>/<SIP folder>/harvest.xml (see
+# hinjodl.sip_layout). Packaged SIPs (see hinjodl.packaging) are read from
+# their tar files, as <root>/<set folder>/<SIP>.tar or <root>/<set>.tar.
+# Updates are incremental: a set folder is only read again when its
+# modification time (or that of one of its shards) changed, that is when SIP
+# folders were added, moved away or deleted. The downloader updates the index
+# before every set (and every poll in watch mode). For its membership checks,
+# a Bloom filter is built from the index, so most record IDs are answered
+# without touching the database at all.
+#
+# The index can also be maintained and queried on its own:
+#
+#   python3 -m hinjodl.archive_inventory update inventory.sqlite /download/folder /ingested/folder
+#   python3 -m hinjodl.archive_inventory lookup inventory.sqlite oai:hindawi.com:10.1155/...
+
+
+import os
+import sys
+import argparse
+import hashlib
+import math
+import sqlite3
+import tarfile
+import threading
+from hinjodl.sip_layout import list_sips
+
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS set_folders (
+        path TEXT PRIMARY KEY,
+        mtime REAL NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS records (
+        record_id TEXT NOT NULL,
+        sip_path TEXT NOT NULL,
+        set_folder TEXT NOT NULL,
+        PRIMARY KEY (record_id, sip_path)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS records_set_folder ON records (set_folder);
+    CREATE TABLE IF NOT EXISTS shard_folders (
+        path TEXT PRIMARY KEY,
+        set_folder TEXT NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS shard_folders_set_folder ON shard_folders (set_folder);
+'''
+
+
+class BloomFilter:
+
+    """Compact set of strings. No false negatives, false positives at about the given rate."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2)**2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def read_object_identifier(sip_folder):
+
+    """Returns the OAI identifier from the harvest.xml of a SIP, None if there is none."""
+
+    from lxml import etree      # only needed when set folders changed
+
+    harvest_file = os.path.join(sip_folder, 'harvest.xml')
+    if not os.path.isfile(harvest_file):
+        return None
+    try:
+        return etree.parse(harvest_file).getroot().findtext('objectIdentifier')
+    except etree.XMLSyntaxError:
+        return None
+
+
+def is_package(entry):
+
+    """Tells if a directory entry is a SIP or set package (see hinjodl.packaging)."""
+
+    return entry.name.endswith('.tar') and entry.is_file(follow_symlinks=False)
+
+
+def folder_mtime(path):
+
+    """Returns the modification time of a folder, 0 if it is gone."""
+
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+class ArchiveInventory:
+
+    """Index of downloaded and ingested SIPs by OAI identifier. Safe to share between threads."""
+
+    def __init__(self, filename):
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.bloom_filter = None
+
+    def update(self, roots):
+
+        """
+        Brings the index up to date with the given trees, reading only
+        set folders that changed. Returns the number of set folders read.
+        """
+
+        current = {}
+        for root in roots:
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    # set folders, or set packages written with '--packagescope set'
+                    if entry.is_dir(follow_symlinks=False) or is_package(entry):
+                        current[os.path.abspath(entry.path)] = entry.stat().st_mtime
+
+        with self.lock, self.connection:
+            known = dict(self.connection.execute('SELECT path, mtime FROM set_folders'))
+            known_shards = {}
+            for path, set_folder in self.connection.execute('SELECT path, set_folder FROM shard_folders'):
+                known_shards.setdefault(set_folder, []).append(path)
+
+            for path in known.keys() - current.keys():
+                self.connection.execute('DELETE FROM records WHERE set_folder = ?', (path,))
+                self.connection.execute('DELETE FROM shard_folders WHERE set_folder = ?', (path,))
+                self.connection.execute('DELETE FROM set_folders WHERE path = ?', (path,))
+
+            # SIPs added to or moved out of a shard only change the modification time of the shard
+            for path, shards in known_shards.items():
+                if path in current:
+                    current[path] = max([current[path]] + [folder_mtime(shard) for shard in shards])
+
+            changed = [path for path, mtime in current.items() if known.get(path) != mtime]
+            for path in changed:
+                records, shards = self._scan_set_folder(path)
+                self.connection.execute('DELETE FROM records WHERE set_folder = ?', (path,))
+                self.connection.executemany('INSERT OR REPLACE INTO records (record_id, sip_path, set_folder) '
+                                            'VALUES (?, ?, ?)',
+                                            records)
+                self.connection.execute('DELETE FROM shard_folders WHERE set_folder = ?', (path,))
+                self.connection.executemany('INSERT INTO shard_folders (path, set_folder) VALUES (?, ?)',
+                                            ((os.path.abspath(shard), path) for shard in shards))
+                mtime = max([current[path]] + [folder_mtime(shard) for shard in shards])
+                self.connection.execute('INSERT OR REPLACE INTO set_folders (path, mtime) VALUES (?, ?)',
+                                        (path, mtime))
+
+            self._build_bloom_filter()
+
+        return len(changed)
+
+    def _scan_set_folder(self, path):
+
+        """Returns the records [(record_id, SIP path, set folder)] of a set folder or set package, and its shards."""
+
+        if os.path.isfile(path):
+            return list(self._scan_package(path, path)), []
+        sips, shards = list_sips(path)
+        records = []
+        for sip in sips:
+            if sip.is_dir(follow_symlinks=False):
+                record_id = read_object_identifier(sip.path)
+                if record_id:
+                    records.append((record_id, sip.path, path))
+            else:
+                records.extend(self._scan_package(sip.path, path))
+        return records, shards
+
+    def _scan_package(self, package_path, set_folder):
+        from hinjodl.packaging import PackageReader
+
+        try:
+            with PackageReader(package_path) as package:
+                for sip_root in package.sips():
+                    record_id = package.object_identifier(sip_root)
+                    if record_id:
+                        yield record_id, f'{package_path}/{sip_root}', set_folder
+        except tarfile.TarError:
+            return
+
+    def _build_bloom_filter(self):
+        count = self.connection.execute('SELECT COUNT(DISTINCT record_id) FROM records').fetchone()[0]
+        self.bloom_filter = BloomFilter(count)
+        for (record_id,) in self.connection.execute('SELECT DISTINCT record_id FROM records'):
+            self.bloom_filter.add(record_id)
+
+    def __contains__(self, record_id):
+        if self.bloom_filter is not None and record_id not in self.bloom_filter:
+            return False
+        with self.lock:
+            return self.connection.execute('SELECT 1 FROM records WHERE record_id = ? LIMIT 1',
+                                           (record_id,)).fetchone() is not None
+
+    def locations(self, record_id):
+
+        """Returns the SIP folders of a record."""
+
+        with self.lock:
+            return [row[0] for row in self.connection.execute('SELECT sip_path FROM records WHERE record_id = ?',
+                                                              (record_id,))]
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(DISTINCT record_id) FROM records').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Maintain the inventory of downloaded and ingested SIPs.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    update_parser = subparsers.add_parser('update', help='Read new or changed set folders.')
+    update_parser.add_argument('inventory', metavar='DBFILE')
+    update_parser.add_argument('roots', nargs='+', metavar='FOLDER')
+
+    lookup_parser = subparsers.add_parser('lookup', help='Show where a record is.')
+    lookup_parser.add_argument('inventory', metavar='DBFILE')
+    lookup_parser.add_argument('record_id', metavar='OAIID')
+
+    args = parser.parse_args()
+
+    inventory = ArchiveInventory(args.inventory)
+    if args.command == 'update':
+        changed = inventory.update(args.roots)
+        print(f'Read {changed} new or changed set folders, {len(inventory)} records in inventory.')
+    else:
+        locations = inventory.locations(args.record_id)
+        if not locations:
+            print(f'{args.record_id} not found.')
+            sys.exit(1)
+        for location in locations:
+            print(location)
+    inventory.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Crash recovery for the ListIdentifiers harvest of a set.
+#
+# While the downloader pages through a set, it saves the last good resumption
+# token and every record ID received so far. Record IDs that were processed
+# completely are marked as done. If the run dies, the next run for the same
+# set picks up the checkpoint: it continues the listing with the saved token
+# and only works on record IDs that are not done yet.
+#
+# A checkpoint consists of three files per set in the checkpoint folder:
+#   <set>.ids    record IDs in listing order, appended page by page
+#   <set>.json   resumption token, number of valid lines in <set>.ids,
+#                written atomically after the IDs of a page are safe
+#   <set>.done   processed record IDs, appended one by one
+# The checkpoint is removed when the set was listed and processed completely.
+#
+# In watch mode ('--watch') every set also has a watch state, <set>.watch.json:
+# the 'from' date of the next incremental listing and the datestamps of the
+# records processed since then. A record listed again with the same datestamp
+# is unchanged and skipped, the 'from' date only moves forward after a
+# complete poll of the set.
+
+
+import os
+import json
+import datetime
+import threading
+
+
+class ListingCheckpoint:
+
+    """Listing progress of one set: resumption token, record IDs received so far, processed IDs."""
+
+    def __init__(self, folder, set_name):
+
+        os.makedirs(folder, exist_ok=True)
+        base_name = os.path.join(folder, set_name.replace('.', '_').replace(':', '_'))
+        self.state_file = base_name + '.json'
+        self.ids_file = base_name + '.ids'
+        self.done_file = base_name + '.done'
+        self.lock = threading.Lock()
+
+        self.set_name = set_name
+        self.token = None           # resumption token for the next page
+        self.complete = False       # all pages received
+        self.identifiers = []       # record IDs received by the crashed run
+        self.count = 0              # number of record IDs received so far
+        self.done = set()           # record IDs processed by the crashed run
+        self.resumed = self.load()
+
+    def load(self):
+
+        """Reads an existing checkpoint, returns True if there was one."""
+
+        if not os.path.isfile(self.state_file):
+            # no valid checkpoint, make sure we start with empty files
+            for file in (self.ids_file, self.done_file):
+                if os.path.isfile(file):
+                    os.remove(file)
+            return False
+
+        with open(self.state_file, 'r') as file:
+            state = json.load(file)
+        self.token = state['resumption_token']
+        self.complete = state['complete']
+
+        # IDs appended after the last state update belong to an unconfirmed page
+        if os.path.isfile(self.ids_file):
+            with open(self.ids_file, 'r') as file:
+                self.identifiers = [line.rstrip() for line in file][:state['count']]
+        self.count = len(self.identifiers)
+        self._rewrite_ids()
+
+        if os.path.isfile(self.done_file):
+            with open(self.done_file, 'r') as file:
+                self.done = {line.rstrip() for line in file}
+
+        return True
+
+    def _rewrite_ids(self):
+        with open(self.ids_file, 'w') as file:
+            file.writelines(f'{identifier}\n' for identifier in self.identifiers)
+
+    def _write_state(self):
+        state = {'set': self.set_name,
+                 'resumption_token': self.token,
+                 'complete': self.complete,
+                 'count': self.count,
+                 'updated': datetime.datetime.today().isoformat(timespec='seconds')}
+        temp_file = self.state_file + '.tmp'
+        with open(temp_file, 'w') as file:
+            json.dump(state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, self.state_file)
+
+    def add_page(self, identifiers, token):
+
+        """Saves the new record IDs of a page, then the token for the next one."""
+
+        with open(self.ids_file, 'a') as file:
+            file.writelines(f'{identifier}\n' for identifier in identifiers)
+            file.flush()
+            os.fsync(file.fileno())
+        self.count += len(identifiers)
+        self.token = token
+        self.complete = not token
+        self._write_state()
+
+    def restart(self):
+
+        """Starts the listing from the beginning, e.g. after the token expired. Known IDs are kept."""
+
+        self.token = None
+        self.complete = False
+        self._write_state()
+
+    def mark_done(self, record_id):
+
+        """Remembers a record ID as processed."""
+
+        with self.lock, open(self.done_file, 'a') as file:
+            file.write(f'{record_id}\n')
+
+    def remove(self):
+
+        """Deletes the checkpoint files."""
+
+        for file in (self.state_file, self.ids_file, self.done_file):
+            if os.path.isfile(file):
+                os.remove(file)
+
+
+class WatchState:
+
+    """Incremental harvesting of one set in watch mode: 'from' date of the next listing, processed records."""
+
+    def __init__(self, folder, set_name):
+
+        os.makedirs(folder, exist_ok=True)
+        self.state_file = os.path.join(folder, set_name.replace('.', '_').replace(':', '_') + '.watch.json')
+        self.set_name = set_name
+        self.from_date = None       # None until the first complete listing of the set
+        self.processed = {}         # {record ID: datestamp} of records processed since from_date
+        self.listed = {}            # {record ID: datestamp} of the current poll
+        self.changed_count = 0      # records listed as new or changed in the current poll
+        self.lock = threading.Lock()
+
+        if os.path.isfile(self.state_file):
+            with open(self.state_file, 'r') as file:
+                state = json.load(file)
+            self.from_date = state['from']
+            self.processed = state['processed']
+
+    def is_unchanged(self, record_id, datestamp):
+
+        """Tells if a record was processed before in the same version. Remembers the datestamp otherwise."""
+
+        if datestamp is not None and self.processed.get(record_id) == datestamp:
+            return True
+        with self.lock:
+            self.listed[record_id] = datestamp
+            self.changed_count += 1
+        return False
+
+    def mark_processed(self, record_id):
+
+        """Remembers a record as processed in the version listed in this poll."""
+
+        with self.lock:
+            datestamp = self.listed.pop(record_id, None)
+            if datestamp is not None:
+                self.processed[record_id] = datestamp
+
+    def advance(self, from_date):
+
+        """Sets the 'from' date of the next poll, forgets records that were changed before it."""
+
+        with self.lock:
+            self.from_date = from_date
+            self.processed = {record_id: datestamp for record_id, datestamp in self.processed.items()
+                              if datestamp >= from_date}
+
+    def save(self):
+
+        """Writes the state atomically."""
+
+        with self.lock:
+            state = {'set': self.set_name,
+                     'from': self.from_date,
+                     'processed': self.processed,
+                     'updated': datetime.datetime.today().isoformat(timespec='seconds')}
+            self.listed = {}
+        temp_file = self.state_file + '.tmp'
+        with open(temp_file, 'w') as file:
+            json.dump(state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, self.state_file)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Checksums of downloaded files. All configured digests (by default MD5 and
+# SHA-256) are computed in the one pass that writes a file, no file is ever
+# read again to checksum it. The results go to a manifest, a tab separated
+# file with one line per file:
+#
+#   path    size    md5    sha256
+#   <oai_id>/MASTER/12345.pdf    1048576    9e107d9d...    d7a8fbb3...
+#
+# written into every SIP ('manifest.tsv', paths relative to the SIP) or once
+# per set (paths relative to the set folder). The legacy layout of one
+# '<file>.md5' sidecar file per downloaded file is still available.
+
+
+import hashlib
+import threading
+
+
+default_algorithms = ('md5', 'sha256')
+manifest_name = 'manifest.tsv'
+
+
+def parse_algorithms(text):
+
+    """Returns the digest algorithms in a comma separated list, e.g. 'md5,sha256'. Raises ValueError for unknown ones."""
+
+    algorithms = tuple(dict.fromkeys(name.strip().lower() for name in text.split(',') if name.strip()))
+    if not algorithms:
+        raise ValueError('No checksum algorithm given.')
+    for algorithm in algorithms:
+        if algorithm not in hashlib.algorithms_available or algorithm.startswith('shake_'):
+            raise ValueError(f'Unknown checksum algorithm {algorithm}.')
+    return algorithms
+
+
+class MultiDigest:
+
+    """Computes several digests (and the size) of data fed to it in chunks."""
+
+    __slots__ = ('hashes', 'size')
+
+    def __init__(self, algorithms):
+        self.hashes = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+        self.size = 0
+
+    def update(self, data):
+        for digest in self.hashes.values():
+            digest.update(data)
+        self.size += len(data)
+
+    def hexdigests(self):
+
+        """Returns {algorithm: hex digest}."""
+
+        return {algorithm: digest.hexdigest() for algorithm, digest in self.hashes.items()}
+
+
+class HashingFile:
+
+    """Binary file opened for writing that keeps a MultiDigest of everything written to it."""
+
+    def __init__(self, file, algorithms):
+        self.file = file
+        self.digest = MultiDigest(algorithms)
+
+    def write(self, data):
+        self.file.write(data)
+        self.digest.update(data)
+        return len(data)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def manifest_header(algorithms):
+    return '\t'.join(('path', 'size') + tuple(algorithms)) + '\n'
+
+
+def manifest_lines(algorithms, entries, folder=''):
+
+    """
+    Returns the manifest lines of [(name, MultiDigest)], file names are
+    prefixed with folder if given.
+    """
+
+    lines = []
+    for name, digest in entries:
+        hexdigests = digest.hexdigests()
+        path = f'{folder}/{name}' if folder else name
+        lines.append('\t'.join([path, str(digest.size)] + [hexdigests[algorithm] for algorithm in algorithms]) + '\n')
+    return ''.join(lines)
+
+
+def sidecar_content(filename, algorithm, digest):
+
+    """Returns the content of a legacy sidecar file '<file>.<algorithm>', like md5sum writes it."""
+
+    return f'{digest.hexdigests()[algorithm]}  {filename}\n'
+
+
+class SetManifest:
+
+    """
+    Manifest of a whole set, SIPs are appended as they are committed. Safe to
+    share between threads.
+    """
+
+    def __init__(self, path, algorithms):
+        self.path = path
+        self.algorithms = algorithms
+        self.file = open(path, 'w', encoding='utf-8')
+        self.file.write(manifest_header(algorithms))
+        self.file.flush()
+        self.lock = threading.Lock()
+        self.entry_count = 0
+
+    def add(self, folder_name, entries):
+        lines = manifest_lines(self.algorithms, entries, folder_name)
+        with self.lock:
+            self.file.write(lines)
+            self.file.flush()     # the lines of committed SIPs survive a crash
+            self.entry_count += len(entries)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_manifest(path):
+
+    """Yields a dictionary per file in a manifest: {'path': ..., 'size': int, 'md5': ..., ...}."""
+
+    with open(path, 'r', encoding='utf-8') as manifest_file:
+        columns = manifest_file.readline().rstrip('\n').split('\t')
+        for line in manifest_file:
+            values = line.rstrip('\n').split('\t')
+            if len(values) != len(columns):
+                continue
+            entry = dict(zip(columns, values))
+            entry['size'] = int(entry['size'])
+            yield entry
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Command line interface of the downloader: 'hinjodl' after installation,
+# 'python3 -m hinjodl' or the old 'hindawi-downloader.py'. Only argparse and
+# logging (see hinjodl.log) are set up here, the harvester is imported once
+# the arguments are known to be fine.
+
+
+import argparse
+import datetime
+import logging
+from hinjodl.log import start_logging
+from hinjodl.checksums import parse_algorithms
+
+
+def build_parser():
+
+    """Returns the parser of the command line arguments. Also used to build Harvester options."""
+
+    parser = argparse.ArgumentParser(prog='hinjodl', description='Download Hindawi article files per OAI-PMH set.')
+
+    parser.add_argument('oaiset',
+                        type=str,
+                        nargs='?',
+                        metavar='SET or SETFILE',
+                        help='A valid Hindawi set to download or a text file containing one set per line.')
+    parser.add_argument('--oaiid',
+                        nargs='+',
+                        metavar='IDENTIFIER(S)',
+                        help='Only work on this, ignore rest of set. Accepts strings or newline separated text file.')
+    parser.add_argument('--urllut',
+                        metavar='LUTFILE',
+                        help='Use URL lookup table (SQLite store or JSON file), containing a mapping of DOIs and corresponding Hindawi URLs.')
+    parser.add_argument('--countrecords',
+                        action='store_true',
+                        default=False,
+                        help='Do not download article data, just count OAI records in (sub-)sets.')
+    parser.add_argument('--countworkers',
+                        type=int,
+                        default=8,
+                        metavar='N',
+                        help='Number of sets counted in parallel with --countrecords (default: 8).')
+    parser.add_argument('--makesetfile',
+                        metavar='SETFILE',
+                        help='Creates a text file with a list of subsets of a given set.')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=4,
+                        metavar='N',
+                        help='Number of articles downloaded concurrently (default: 4).')
+    parser.add_argument('--cpuworkers',
+                        type=int,
+                        default=0,
+                        metavar='N',
+                        help='Number of processes parsing article pages and generating XML, '
+                             '0 to do that in the article workers (default: 0).')
+    parser.add_argument('--rate',
+                        type=float,
+                        default=5.0,
+                        metavar='REQUESTS',
+                        help='Maximum number of requests per second to Hindawi, 0 for no limit (default: 5).')
+    parser.add_argument('--largefile',
+                        type=float,
+                        default=100,
+                        metavar='MIB',
+                        help='Supplements larger than this are downloaded in a separate lane, 0 to disable (default: 100).')
+    parser.add_argument('--largeworkers',
+                        type=int,
+                        default=2,
+                        help='Number of concurrent downloads in the large file lane (default: 2).')
+    parser.add_argument('--bandwidth',
+                        type=float,
+                        default=0,
+                        metavar='KIBPERSECOND',
+                        help='Maximum bandwidth of all file downloads together, 0 for no limit (default: 0).')
+    parser.add_argument('--bandwidthfile',
+                        metavar='FILE',
+                        help='File with the bandwidth limit in KiB/s, checked every 10 seconds and '
+                             'applied when changed (overrides --bandwidth).')
+    parser.add_argument('--articledeadline',
+                        type=int,
+                        default=3600,
+                        metavar='SECONDS',
+                        help='Time limit for processing a single article, 0 for no limit (default: 3600). '
+                             'Time held back by --bandwidth does not count, large files add their '
+                             'transfer time at --minthroughput.')
+    parser.add_argument('--minthroughput',
+                        type=float,
+                        default=10.0,
+                        metavar='KIBPERSECOND',
+                        help='Minimum average rate of a file download after one minute, 0 for no limit (default: 10).')
+    parser.add_argument('--stalltimeout',
+                        type=int,
+                        default=300,
+                        metavar='SECONDS',
+                        help='Hand an article over to a new worker after this long without progress, 0 to disable (default: 300).')
+    parser.add_argument('--duplicates',
+                        choices=['link', 'skip', 'download'],
+                        default='link',
+                        help='What to do with records already processed for another set: link to the existing SIP, '
+                             'skip them or download them again (default: link).')
+    parser.add_argument('--package',
+                        choices=['none', 'tar', 'bagit'],
+                        default='none',
+                        help='Write SIPs as tar files or as BagIt bags in tar files instead of folders (default: none).')
+    parser.add_argument('--packagescope',
+                        choices=['sip', 'set'],
+                        default='sip',
+                        help='With --package, write one package per SIP or one per set (default: sip).')
+    parser.add_argument('--layout',
+                        choices=['flat', 'hash', 'doiprefix'],
+                        default='flat',
+                        help='Put the SIPs directly into the set folder (flat), or spread them over subfolders by '
+                             'a hash of their name (hash, up to 256) or by DOI without its last part (doiprefix, '
+                             'for Hindawi the year) (default: flat).')
+    parser.add_argument('--checksums',
+                        default='md5,sha256',
+                        metavar='ALGORITHMS',
+                        help='Comma separated checksum algorithms computed while files are downloaded (default: md5,sha256).')
+    parser.add_argument('--manifest',
+                        choices=['sip', 'set', 'sidecar'],
+                        default='sip',
+                        help='Write checksums to a manifest.tsv per SIP or per set, or to a sidecar file '
+                             'per downloaded file and algorithm, e.g. 123.pdf.md5 (default: sip).')
+    parser.add_argument('--s3endpoint',
+                        metavar='URL',
+                        help='Endpoint of the S3-compatible object store, when download_to.cfg names a bucket '
+                             '(s3://bucket/prefix), e.g. http://localhost:9000 for MinIO (default: AWS).')
+    parser.add_argument('--uploadworkers',
+                        type=int,
+                        default=8,
+                        metavar='N',
+                        help='Number of concurrent part uploads to the object store (default: 8).')
+    parser.add_argument('--seenindex',
+                        metavar='DBFILE',
+                        help='Keep the index of processed records in this SQLite file, so it also applies to later runs.')
+    parser.add_argument('--inventory',
+                        metavar='DBFILE',
+                        help='Skip records that already have a SIP in the download folder or an ingested folder, '
+                             'using an inventory kept in this SQLite file.')
+    parser.add_argument('--ingested',
+                        action='append',
+                        default=[],
+                        metavar='FOLDER',
+                        help='Folder with ingested set folders for --inventory, can be given several times.')
+    parser.add_argument('--hedge',
+                        action='store_true',
+                        default=False,
+                        help='Send a second request for article pages slower than 95 %% of the recent ones, use the faster answer.')
+    parser.add_argument('--watch',
+                        type=float,
+                        metavar='MINUTES',
+                        help='Keep running and poll the given sets for new or changed records every MINUTES minutes, '
+                             'until stopped with SIGTERM or Ctrl-C.')
+    parser.add_argument('--rebuild-metadata',
+                        nargs='?',
+                        const='',
+                        metavar='FOLDER',
+                        help='Do not download, regenerate dc.xml, harvest.xml and collection.xml of existing SIPs '
+                             'in FOLDER (default: download folder) from saved OAI records and page extracts.')
+    parser.add_argument('--rebuildworkers',
+                        type=int,
+                        default=0,
+                        metavar='N',
+                        help='Number of processes used by --rebuild-metadata (default: number of CPUs).')
+    parser.add_argument('--loglevel',
+                        default='INFO',
+                        metavar='LEVEL',
+                        help='Standard Python log levels. Set to DEBUG for a nice, bloated log file.')
+    parser.add_argument('--logformat',
+                        choices=['text', 'json'],
+                        default='text',
+                        help='Format of the log file: plain text or JSON lines with set and record fields (default: text).')
+    parser.add_argument('--version',
+                        action='store_true',
+                        default=False,
+                        help='Print the version and exit.')
+
+    return parser
+
+
+def main(argv=None):
+
+    """Entry point of the command line interface, returns the exit status."""
+
+    parser = build_parser()
+    cl_args = parser.parse_args(argv)
+
+    if cl_args.version:
+        from hinjodl.version import get_version
+        print(get_version() or 'unknown')
+        return 0
+    if cl_args.oaiset is None and cl_args.rebuild_metadata is None:
+        parser.error('SET or SETFILE is required, unless --rebuild-metadata is used.')
+    if cl_args.ingested and not cl_args.inventory:
+        parser.error('--ingested requires --inventory.')
+    if cl_args.watch is not None:
+        if cl_args.watch <= 0:
+            parser.error('--watch needs a positive number of minutes.')
+        if cl_args.countrecords or cl_args.makesetfile or cl_args.oaiid or cl_args.rebuild_metadata is not None:
+            parser.error('--watch can not be combined with --countrecords, --makesetfile, --oaiid or --rebuild-metadata.')
+    try:
+        parse_algorithms(cl_args.checksums)
+    except ValueError as error:
+        parser.error(f'--checksums: {error}')
+
+    # human readable timestamp used in output file names
+    timestamp = datetime.datetime.today().strftime('%Y-%m-%d_%H-%M-%S')
+    log_listener = start_logging(timestamp, cl_args.loglevel, cl_args.logformat)
+    logger = logging.getLogger(__name__)
+
+    # log given command line parameters
+    logger.debug(f'oaiset is {cl_args.oaiset}.')
+    logger.debug(f'countrecords is {cl_args.countrecords}.')
+    logger.debug(f'makesetfile is {cl_args.makesetfile}.')
+    logger.debug(f'loglevel is {cl_args.loglevel}.')
+
+    from hinjodl.harvester import Harvester, HarvesterError
+
+    harvester = Harvester(cl_args, timestamp)
+    try:
+        harvester.run()
+    except HarvesterError as error:
+        logger.error(str(error))
+        logger.info('Exiting gracefully.')
+        return 1
+    finally:
+        harvester.close()
+        log_listener.stop()     # writes what is left in the queue
+    return 0
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Checks of downloaded files, done while the file streams in.
+#
+# Instead of listing the SIP folders again after the downloads and looking at
+# the file sizes, every chunk passes through a StreamCheck on its way to the
+# disk. It counts the bytes, compares the total with the Content-Length of
+# the response and looks at the first bytes of the file: a PDF has to start
+# with a PDF header, a DOCX with a ZIP header and so on. This also catches
+# HTML error pages that the server delivers with status 200 under the name
+# of the requested file. Such files keep the SIP out of the set folder, as
+# does an article PDF without PDF header. Other files that do not start like
+# their extension says, mostly old supplements (a '.doc' that is RTF, an
+# '.xls' that is CSV or an Office web page), are only reported.
+#
+# Only obvious cases are logged here: empty, tiny and huge files. Whether a
+# size is unusual for its journal and file type is a question for all files
+# together, see hinjodl.size_anomalies.
+
+
+import os
+import logging
+
+
+# the first bytes of a file are kept for sniffing
+HEAD_SIZE = 1024
+
+# leading bytes of known file types, by extension
+MAGIC_BYTES = {'.pdf': (b'%PDF-',),
+               '.zip': (b'PK\x03\x04',),
+               '.docx': (b'PK\x03\x04',),
+               '.xlsx': (b'PK\x03\x04',),
+               '.pptx': (b'PK\x03\x04',),
+               '.epub': (b'PK\x03\x04',),
+               '.odt': (b'PK\x03\x04',),
+               '.doc': (b'\xd0\xcf\x11\xe0',),
+               '.xls': (b'\xd0\xcf\x11\xe0',),
+               '.ppt': (b'\xd0\xcf\x11\xe0',),
+               '.png': (b'\x89PNG',),
+               '.jpg': (b'\xff\xd8\xff',),
+               '.jpeg': (b'\xff\xd8\xff',),
+               '.gif': (b'GIF8',),
+               '.tif': (b'II*\x00', b'MM\x00*'),
+               '.tiff': (b'II*\x00', b'MM\x00*'),
+               '.gz': (b'\x1f\x8b',)}
+
+HTML_STARTS = (b'<!doctype html', b'<html', b'<head', b'<body')
+OFFICE_HTML = b'urn:schemas-microsoft-com:office'     # Word or Excel document saved as web page
+
+SMALL_FILE = 1024
+LARGE_FILE = 2 * 1024**3
+
+
+class StreamCheck:
+
+    """
+    Validates a file chunk by chunk while it is downloaded.
+
+    After finish(), 'complete' tells whether all announced bytes arrived and
+    'valid' whether the file can go into the SIP: it is no HTML error page
+    and, for the article PDF (article_pdf=True), a PDF. finish() returns the
+    findings as a list of (log level, message).
+    """
+
+    def __init__(self, filename, expected_length=None, article_pdf=False):
+        self.filename = filename
+        self.extension = os.path.splitext(filename)[1].lower()
+        self.expected_length = expected_length
+        self.article_pdf = article_pdf
+        self.size = 0
+        self.head = b''
+        self.complete = True
+        self.valid = True
+
+    def update(self, chunk):
+        self.size += len(chunk)
+        if len(self.head) < HEAD_SIZE:
+            self.head += chunk[:HEAD_SIZE - len(self.head)]
+
+    def finish(self):
+        findings = []
+
+        if self.expected_length is not None and self.size != self.expected_length:
+            self.complete = False
+            findings.append((logging.WARNING, f'Received {self.size} bytes of {self.filename}, '
+                                              f'but {self.expected_length} bytes were announced.'))
+            return findings
+
+        leading_bytes = self.head.lstrip().lower()
+        if self.extension not in ('.html', '.htm') and leading_bytes.startswith(HTML_STARTS):
+            if OFFICE_HTML in self.head and not self.article_pdf:
+                findings.append((logging.WARNING, f'{self.filename} is an Office document saved as HTML.'))
+            else:
+                self.valid = False
+                findings.append((logging.ERROR, f'{self.filename} is an HTML page, probably an error message of the server.'))
+        elif self.extension == '.pdf' and MAGIC_BYTES['.pdf'][0] not in self.head:
+            # PDF readers accept some junk before the header within the first KiB
+            if self.article_pdf:
+                self.valid = False
+                findings.append((logging.ERROR, f'{self.filename} does not contain a PDF header.'))
+            else:
+                findings.append((logging.WARNING, f'{self.filename} does not contain a PDF header, keeping it.'))
+        elif self.extension in MAGIC_BYTES and self.extension != '.pdf' \
+                and not self.head.startswith(MAGIC_BYTES[self.extension]):
+            findings.append((logging.WARNING, f'{self.filename} does not start like a {self.extension} file, keeping it.'))
+
+        mibsize = self.size/(1024**2)
+        if self.size == 0:
+            findings.append((logging.ERROR, f'Empty file detected: {self.filename}.'))
+        elif self.size < SMALL_FILE:
+            findings.append((logging.ERROR, f'Suspiciously small file detected: {self.filename}.'))
+        elif self.size > LARGE_FILE:
+            findings.append((logging.WARNING, f'Suspiciously large file detected: {self.filename} is {mibsize} MiB.'))
+
+        return findings
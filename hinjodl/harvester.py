@@ -0,0 +1,1926 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# The downloader itself: harvests OAI-PMH sets, downloads the article files
+# and builds a SIP per record. Everything that belongs to a run lives in a
+# Harvester object, so several runs can be made from one process. Parsers
+# (bs4, lxml) and the OAI-PMH client (Sickle) are imported when first needed.
+
+
+import os
+import re
+import csv
+import json
+import time
+import queue
+import datetime
+import logging
+import tempfile
+import threading
+import signal
+import requests
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, TimeoutError as FutureTimeout
+from shutil import rmtree
+from hinjodl.urllut_store import UrlLookupTable
+from hinjodl.throttling import TokenBucket, RateFileWatcher
+from hinjodl.checkpoints import ListingCheckpoint, WatchState
+from hinjodl.seen_records import SeenRecords
+from hinjodl.page_extracts import PageExtractCache
+from hinjodl.file_checks import StreamCheck
+from hinjodl.archive_inventory import ArchiveInventory
+from hinjodl.hedging import LatencyTracker, hedged_call
+from hinjodl.timeouts import Deadline, ThroughputGuard, StallWatchdog, \
+    DeadlineExceeded, TransferStalled, TaskCancelled
+from hinjodl.version import get_version
+from hinjodl.log import LevelCounter, set_log_context
+from hinjodl.packaging import PackagedSip, TarPackage
+from hinjodl.storage import open_storage
+from hinjodl.sip_layout import sip_folder_name, sip_location
+from hinjodl.report_files import BatchedAppendFile
+from hinjodl.checksums import SetManifest, parse_algorithms, manifest_name, manifest_header, \
+    manifest_lines, sidecar_content
+
+
+logger = logging.getLogger(__name__)
+
+appendix_pattern = re.compile(r'\d*\.f\d*\..*')     # file names of supplements
+article_pdf_pattern = re.compile(r'\d*\.pdf', re.IGNORECASE)
+
+
+class HarvesterError(Exception):
+
+    """A run can not go on. The message tells the user why."""
+
+
+class Article:
+
+    """State of a single article retrieval (one OAI record)."""
+
+    __slots__ = ('record_id', 'folder_name', 'relative_path', 'sip', 'url', 'page_url', 'page_dc', 'license_string', 'issn_string', 'publisher_string',
+                 'supplementary_materials_exist', 'pending_parts', 'all_downloaded',
+                 'article_pdf_found', 'rejected_files', 'checksums', 'page_extracts', 'deadline', 'cancelled', 'last_progress')
+
+    def __init__(self, record_id, deadline_seconds):
+        self.record_id = record_id
+        self.folder_name = sip_folder_name(record_id)
+        self.relative_path = self.folder_name     # in the set folder, see hinjodl.sip_layout
+        self.sip = None                     # writer of the SIP, see hinjodl.packaging and hinjodl.storage
+        self.url = None                     # DOI or remapped URL
+        self.page_url = None                # article page after redirects
+        self.page_dc = {}                   # Dublin Core metadata scraped from article page
+        self.license_string = None
+        self.issn_string = None
+        self.publisher_string = None
+        self.supplementary_materials_exist = False
+        self.pending_parts = 1              # downloads still running: small files plus each large file
+        self.all_downloaded = True
+        self.article_pdf_found = False
+        self.rejected_files = []            # downloaded, but not what they claim to be
+        self.checksums = []                 # [(file in the SIP, MultiDigest)] of downloaded files
+        self.page_extracts = None           # cached once the SIP is committed, see hinjodl.page_extracts
+        self.deadline = Deadline(deadline_seconds)
+        self.cancelled = threading.Event()  # set by the stall watchdog
+        self.last_progress = time.monotonic()
+
+    def progress(self):
+
+        """Heartbeat for the stall watchdog. Raises if the article was cancelled or is out of time."""
+
+        self.last_progress = time.monotonic()
+        if self.cancelled.is_set():
+            raise TaskCancelled(f'Processing of record {self.record_id} was cancelled.')
+        self.deadline.check()
+
+
+def report_rmtree_fail(function, path, excinfo):
+
+    """Logs failure to remove a folder."""
+
+    logger.error(f'Error while deleting folder {path}.')
+    logger.error(f'rmtree reports: {excinfo}')
+
+
+def parse_setfile(filename):
+
+    """Read given setfile, return as list."""
+
+    logger.debug(f'Creating list from setfile {filename}.')
+
+    with open(filename, 'r') as file:
+        sets = file.readlines()
+        # get rid of newline characters
+        sets = [i.rstrip() for i in sets]
+    return sets
+
+
+def parse_record_list(filename):
+
+    """
+    Read file with OAI PMH record ids, return as list.
+
+    This function is part of the resume-from-crash feature. The downloader
+    writes all remaining record ids of a set to a text file, which can be
+    passed per the '--oaiid' argument, after a download stopped due to an
+    exception.
+
+    While this is not an issue for normal-sized sets, it can be quite annoying
+    to see a 2000-records download fail somewhere in the 1700s. This is a
+    workaround. The exceptions experienced occur in the requests (or urllib3)
+    module. Further analyzing needed. There is propably a way to configure
+    request's behavior, or it should be called with exception handling.
+    """
+
+    # TODO: See docstring.
+
+    logger.debug(f'Creating list from OAI record file {filename}.')
+
+    with open(filename, 'r') as file:
+        oia_ids = file.readlines()
+        # get rid of newline characters
+        oai_ids = [i.rstrip() for i in oia_ids]
+    return oai_ids
+
+
+def map_json_to_dict(file):
+
+    """Opens a JSON file and returns the content as a dictionary."""
+
+    logger.debug(f'Trying to parse JSON file {file}.')
+
+    with open(file, 'r') as jsonfile:
+        jdict = json.load(jsonfile)
+
+    return jdict
+
+
+def open_url_lookup_table(file):
+
+    """Returns a DOI to URL mapping from an SQLite store or (small) JSON file."""
+
+    if file.lower().endswith('.json'):
+        logger.info('Loading JSON URL lookup table into memory. Consider importing it with hinjodl.urllut_store.')
+        return map_json_to_dict(file)
+
+    logger.debug(f'Opening URL lookup table {file}.')
+    url_lookup_table = UrlLookupTable(file)
+    logger.info(f'Using URL lookup table {file} with {len(url_lookup_table)} entries.')
+    return url_lookup_table
+
+
+def analyze_set(current_set):
+
+    """Decides if string is a set, subset or garbage by judging its looks."""
+
+    logger.debug(f'Analyzing set {current_set}.')
+
+    if current_set.split('.')[0] != 'HINDAWI':
+        return 'garbage'
+    elif ':' in current_set:
+        return 'subset'
+    else:
+        return 'set'
+
+
+# TODO: add function that reads formerly processed record headers (id, datestamp) from
+# database or xml file and compares those to the current record id list. Three cases:
+# a) record id differs: proceed
+# b) record id matches, datestamp matches: eliminate from list, generate warning (likely wrong input)
+# c) record id matches, datestamp differs: download, make new version in archive
+# Case c does not have an established workflow yet.
+
+
+def open_download_storage(destination, endpoint_url=None, workers=8):
+
+    """Opens the download folder or bucket (see hinjodl.storage)."""
+
+    try:
+        storage = open_storage(destination, endpoint_url, workers)
+    except ImportError:
+        raise HarvesterError(f'Writing to {destination} needs boto3. Please install it (pip3 install .[s3]).')
+    except Exception as error:      # errors of boto3, e.g. no such bucket or no credentials
+        raise HarvesterError(f'Can not access {destination}: {error}')
+    if not storage.is_local:
+        logger.info(f'Writing SIPs to object store {storage}.')
+    return storage
+
+
+def get_download_path(cfg_file):
+
+    """Read download path from file."""
+
+    with open(cfg_file, 'r') as file:
+        path = file.readline().rstrip()
+
+    logger.info(f'Trying download folder {path}.')
+    return path
+
+
+def process_alive(pid):
+
+    """Checks if a process with the given pid is running."""
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def retry_download(links, link):
+
+    """Appends a failed link to the download list again. Returns False if it failed too often."""
+
+    if links.count(link) > 3:
+        logger.error('Download failed multiple times, giving up.')
+        return False
+    links.append(link)
+    logger.info('Will try again.')
+    time.sleep(2*links.count(link))
+    return True
+
+
+def get_expected_length(response):
+
+    """Returns the Content-Length of a response, None if it does not tell the size of the decoded body."""
+
+    content_length = response.headers.get('Content-Length', '')
+    if not content_length.isdigit() or response.headers.get('Content-Encoding', 'identity') != 'identity':
+        return None
+    return int(content_length)
+
+
+def find_sip_folders(folder):
+
+    """Yields all folders below the given one that contain an OAI record file."""
+
+    for path, folders, filenames in os.walk(folder):
+        if 'oai-record.xml' in filenames:
+            folders.clear()         # no SIPs inside SIPs
+            yield path
+        # skip the staging area (and other hidden folders)
+        folders[:] = [name for name in folders if not name.startswith('.')]
+
+
+class Harvester:
+
+    """
+    One run of the downloader, configured by the options of the command line
+    interface (see hinjodl.cli.build_parser()).
+
+    Creating a Harvester has no side effects. run() does the work, close()
+    releases threads and databases afterwards, also when run() failed.
+    """
+
+    base_url = 'https://www.hindawi.com/oai-pmh/oai.aspx'
+    config_file = 'download_to.cfg'
+    page_extracts_cache = 'page_extracts.sqlite'    # article page data for rebuilding, see hinjodl.page_extracts
+    page_extracts_folder = 'page_extracts'      # the same, as cached by older versions
+    checkpoint_folder = 'checkpoints'           # listing checkpoints of unfinished sets
+    record_queue_size = 200                     # record IDs waiting for a worker, bounds memory
+    unfinished_ids_interval = 10                # seconds between rewrites of the remaining record IDs
+    # (connect, read) timeouts in seconds per request type, read timeouts are also capped by the article deadline
+    phase_timeouts = {'oai': (10, 120),
+                      'page': (10, 60),
+                      'file': (10, 60)}
+    download_chunk_size = 64 * 1024             # files are streamed to disk in chunks of this size
+    throughput_grace_period = 60                # seconds before --minthroughput applies to a download
+    hedge_percentile = 95
+
+    def __init__(self, options, timestamp=None):
+        self.options = options
+        # human readable timestamp used in output file names
+        self.timestamp = timestamp or datetime.datetime.today().strftime('%Y-%m-%d_%H-%M-%S')
+        self.version = None
+        self.log_counter = LevelCounter()   # warnings and errors of this run, see harvest()
+        self.checksum_algorithms = parse_algorithms(options.checksums)
+
+        # statistics and structural information
+        self.journal_titles = {}            # dictionary: {'setSpec': 'Journal Title'}
+        self.set_statistics = {}            # used as nested dictionary:
+                                            # {'set': {'set': n, 'subset': m, ...}}
+        self.failed_record_ids = {}         # download for these oai records failed
+        self.set_overlap = {}               # {'set': {'set processed first': number of records}}
+        self.archived_records = {}          # {'set': number of records skipped, because they are in the archive}
+        self.set_catalog = None             # [(setSpec, setName), ...] from ListSets, see get_set_catalog()
+
+        # shared between article workers
+        self.state_lock = threading.Lock()  # guards the structures above and report files
+        self.worker_count = 0               # article workers started so far, used for thread names
+        self.abandoned_workers = set()      # stalled workers that were replaced, see replace_stalled_worker()
+        self.watchdog = None                # StallWatchdog of the running pipeline round
+        self.large_file_tasks = []          # downloads in the large file lane of the current round
+        self.page_latency = LatencyTracker()
+        self.hedge_statistics = {'requests': 0, 'hedged': 0, 'won': 0}
+        self.cpu_stage_times = {}           # {stage: [articles, seconds]}, see run_cpu_task()
+        self.stop_event = threading.Event()  # set by stop(), e.g. on SIGTERM
+        self.title_tracking = BatchedAppendFile('title_string_tracking.txt')    # see track_title_madness()
+
+        # the set being worked on
+        self.oai_set = None
+        self.journal_set = None
+        self.set_folder_name = None
+        self.missing_md = None              # cases of missing DC metadata
+        self.listing_checkpoint = None
+        self.listed_record_count = 0
+        self.unprocessed_rec_ids = {}       # resume after crash, ordered, dict used as set
+        self.unfinished_ids_written = 0.0   # time of the last write_unfinished_ids()
+        self.retry_attempts = {}
+        self.retry_record_ids = []
+        self.watch_state = None             # WatchState of the current set with '--watch'
+
+        # watch mode, see watch()
+        self.watch_states = {}              # {set: WatchState}
+        self.poll_from_date = None          # start of the current poll, 'from' date of the next one
+        self.poll_record_ids = set()        # records turned into SIPs in the current poll
+
+        # opened by open_run(), released by close()
+        self.download_destination = None
+        self.storage = None                 # LocalStorage or S3Storage, see hinjodl.storage
+        self.staging_folder = None
+        self.doi_url_map = None
+        self.seen_records = None
+        self.page_extracts = None
+        self.archive_inventory = None
+        self.inventory_roots = []           # folders the inventory covers, see update_archive_inventory()
+        self.set_package = None             # TarPackage of the current set with '--packagescope set'
+        self.set_manifest = None            # SetManifest of the current set with '--manifest set'
+        self.request_limiter = None
+        self.bandwidth_limiter = None
+        self.bandwidth_watcher = None
+        self.large_file_executor = None
+        self.hedge_executor = None
+        self.cpu_executor = None            # process pool with '--cpuworkers'
+        self.http_session = None
+        self.sickle = None
+
+    def run(self):
+
+        """Downloads the given sets (or counts them, or rebuilds metadata, depending on the options)."""
+
+        self.log_counter.attach()
+
+        # version of the downloader is latest commit datetime
+        self.version = get_version()
+        if not self.version:
+            raise HarvesterError('Can not determine my version. Install the package or run it from a git checkout.')
+        logger.info(f'TIB-LZA Journal Downloader Hindawi/ Version: {self.version}')
+
+        # offline mode, nothing else to do afterwards
+        if self.options.rebuild_metadata is not None:
+            folder = self.options.rebuild_metadata or get_download_path(self.config_file)
+            if folder.startswith('s3://'):
+                raise HarvesterError('--rebuild-metadata only works on local folders.')
+            self.rebuild_metadata(folder)
+            logger.info('Done.')
+            return
+
+        if self.options.watch:
+            self.watch()
+        else:
+            self.harvest()
+
+    def close(self):
+
+        """Stops background threads and closes the stores. The Harvester can not be used afterwards."""
+
+        self.log_counter.detach()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+            self.watchdog = None
+        if self.bandwidth_watcher is not None:
+            self.bandwidth_watcher.stop()
+        if self.set_manifest is not None:
+            self.set_manifest.close()
+            self.set_manifest = None
+        if self.set_package is not None:
+            self.set_package.discard()
+            self.set_package = None
+        for executor in (self.large_file_executor, self.hedge_executor, self.cpu_executor):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        self.title_tracking.flush()
+        for store in (self.seen_records, self.page_extracts, self.archive_inventory, self.doi_url_map, self.http_session, self.storage):
+            if hasattr(store, 'close'):
+                store.close()
+
+    def open_sickle(self):
+
+        """Returns the OAI-PMH harvester. Sickle is imported here, not before it is needed."""
+
+        from hinjodl.oai import PacedSickle
+
+        sickle = PacedSickle(self.base_url, self.request_limiter, session=self.http_session,
+                             timeout=self.phase_timeouts['oai'])
+        logger.info('OAI-PMH harvester initialized.')
+        return sickle
+
+    def get_set_catalog(self):
+
+        """Returns all sets as (setSpec, setName) tuples. ListSets is only crawled once per run."""
+
+        if self.set_catalog is None:
+            logger.debug('Retrieving set catalog (ListSets).')
+            self.set_catalog = [(item.setSpec, item.setName) for item in self.sickle.ListSets()]
+            logger.info(f'Retrieved catalog of {len(self.set_catalog)} sets.')
+        return self.set_catalog
+
+    def get_subsets(self, current_set):
+
+        """Returns a list of subsets (volumes) of a given set (journal)."""
+
+        logger.debug(f'Trying to get subsets for {current_set}.')
+
+        current_subsets = []
+        for setspec, setname in self.get_set_catalog():
+            if ':' in setspec and setspec.split(':')[0] == current_set:
+                current_subsets.append(setspec)
+                logger.info(f'Found matching subset ({setspec}); appending list.')
+
+        return current_subsets
+
+    def get_journal_title(self, current_set):
+
+        """Returns a human readable journal title of a given set."""
+
+        logger.debug(f'Trying to get a journal title for {current_set}.')
+
+        journal_title = None
+        for setspec, setname in self.get_set_catalog():
+            if current_set in setspec and ':' not in setspec:
+                journal_title = setname
+
+        if journal_title:
+            logger.info(f'Adding journal title "{journal_title}" for statistics.')
+            return journal_title
+        else:
+            logger.error(f'Could not get a journal title for set {current_set}. This may lead to a crash later.')
+
+    def append_setfile(self, current_subsets):
+
+        """Writes a given list into a file, one line per item."""
+
+        if not current_subsets:
+            logger.error('Given set did not return subsets. You might want to investigate.')
+            return
+        else:
+            logger.info(f'Writing/appending setfile {self.options.makesetfile}.')
+            with open(self.options.makesetfile, 'a') as setfile:
+                for item in current_subsets:
+                    setfile.write(item + '\n')
+            return
+
+    def list_identifiers(self, current_set, checkpoint, watch_state=None):
+
+        """
+        Yields record IDs of OAI-PMH set while paging through the list.
+
+        Every page is saved in the checkpoint before its IDs are handed out. When
+        the checkpoint comes from a crashed run, its unprocessed IDs come first
+        and the listing continues with the saved resumption token. Only if the
+        server reports the token as expired, the listing starts over; IDs handed
+        out before are skipped then.
+
+        With a watch state, only records changed since its 'from' date are
+        listed, and records processed before in the same version are skipped.
+        """
+
+        from hinjodl.oai import get_identifier_page, BadResumptionToken
+
+        logger.debug(f'Trying to obtain record identifiers for set {current_set}.')
+
+        listed_record_ids = set(checkpoint.identifiers)
+        self.listed_record_count = len(listed_record_ids)
+        restarts = 0
+
+        if checkpoint.resumed:
+            logger.info(f'Resuming set {current_set} from checkpoint: {self.listed_record_count} record IDs listed, '
+                        f'{len(checkpoint.done)} processed.')
+            for record_id in checkpoint.identifiers:
+                if record_id not in checkpoint.done:
+                    yield record_id
+            # only needed for resuming
+            checkpoint.identifiers = []
+            checkpoint.done = set()
+
+        while not checkpoint.complete:
+            if checkpoint.token:
+                params = {'verb': 'ListIdentifiers', 'resumptionToken': checkpoint.token}
+            else:
+                params = {'verb': 'ListIdentifiers', 'metadataPrefix': 'oai_dc', 'set': current_set}
+                if watch_state is not None and watch_state.from_date:
+                    params['from'] = watch_state.from_date
+
+            try:
+                identifiers, token = get_identifier_page(self.sickle, params)
+            except BadResumptionToken:
+                restarts += 1
+                if restarts > 3:
+                    raise
+                logger.warning(f'Server reports resumption token for set {current_set} as expired. Restarting the listing.')
+                checkpoint.restart()
+                continue
+
+            new_identifiers = [(record_id, datestamp) for record_id, datestamp in identifiers
+                               if record_id not in listed_record_ids]
+            checkpoint.add_page([record_id for record_id, datestamp in new_identifiers], token)
+            listed_record_ids.update(record_id for record_id, datestamp in new_identifiers)
+            self.listed_record_count = len(listed_record_ids)
+
+            for record_id, datestamp in new_identifiers:
+                if watch_state is not None and watch_state.is_unchanged(record_id, datestamp):
+                    logger.debug(f'Record {record_id} is unchanged since it was processed. Skipping.')
+                    checkpoint.mark_done(record_id)
+                    continue
+                logger.debug(f'Listed record ID {record_id}.')
+                yield record_id
+
+        logger.info(f'Successfully obtained {str(self.listed_record_count)} record IDs.')
+
+    def count_records(self, current_set):
+
+        """
+        Returns the number of records in a set.
+
+        Most of the time this costs a single request: the resumption token of the
+        first ListIdentifiers page carries the optional 'completeListSize'
+        attribute. Sets that fit on one page come without a token, so their
+        headers are counted right away. Only if the server holds back the list
+        size, all pages of the set are enumerated.
+        """
+
+        from hinjodl.oai import NoRecordsMatch
+
+        logger.debug(f'Counting records in set {current_set}.')
+
+        try:
+            oai_record_headers = self.sickle.ListIdentifiers(metadataPrefix='oai_dc', set=current_set)
+        except NoRecordsMatch:
+            logger.warning(f'Set {current_set} does not contain any records.')
+            return 0
+
+        resumption_token = oai_record_headers.resumption_token
+        if resumption_token is not None and resumption_token.complete_list_size:
+            record_count = int(resumption_token.complete_list_size)
+            logger.info(f'Server reports {record_count} records in set {current_set}.')
+            return record_count
+
+        if resumption_token is not None and resumption_token.token:
+            logger.info(f'No completeListSize for set {current_set}. Counting all record IDs.')
+        record_count = sum(1 for header in oai_record_headers)
+        logger.info(f'Counted {record_count} records in set {current_set}.')
+        return record_count
+
+    def count_records_parallel(self, sets):
+
+        """Counts records of several sets concurrently, returns {set: count}."""
+
+        logger.info(f'Counting records of {len(sets)} sets with {self.options.countworkers} workers.')
+
+        with ThreadPoolExecutor(max_workers=self.options.countworkers) as executor:
+            record_counts = dict(zip(sets, executor.map(self.count_records, sets)))
+
+        return record_counts
+
+    def create_download_folder(self, path):
+
+        """Creates the folder downloads go in."""
+
+        path_head = os.path.split(path)[0]
+        if path_head == '':
+            # this allows a relative path one level beneath the working dir
+            pass
+        elif not os.path.isdir(path_head):
+            raise HarvesterError('Download folder does not exist. Please create manually or '
+                                 f'change to a valid destination in {self.config_file}.')
+
+        if os.path.isdir(path):
+            logger.info('Download folder already exists.')
+            return
+        else:
+            os.mkdir(path)
+            logger.info('Creating general download folder.')
+
+    def clean_staging_area(self):
+
+        """Removes the staging folders of crashed runs (half-written SIPs)."""
+
+        staging_root = os.path.dirname(self.staging_folder)
+        if not os.path.isdir(staging_root):
+            return
+
+        with os.scandir(staging_root) as contents:
+            for item in contents:
+                pid = item.name.rsplit('_', 1)[-1]
+                if pid.isdigit() and process_alive(int(pid)):
+                    continue
+                logger.info(f'Removing leftovers of a crashed run from staging area: {item.name}.')
+                rmtree(item.path, onerror=report_rmtree_fail)
+
+    def create_set_folder(self, current_set):
+
+        """
+        Creates a timestamped folder for the current set (or, with
+        '--packagescope set', its package) and, with '--manifest set', its manifest.
+        """
+
+        self.set_folder_name = current_set.replace('.', '_').replace(':', '_') + '_' + self.timestamp
+        staging_set_path = os.path.join(self.staging_folder, self.set_folder_name)
+        set_path = self.storage.join(self.set_folder_name)
+        os.makedirs(staging_set_path)
+        if self.options.package != 'none' and self.options.packagescope == 'set':
+            target = self.storage.create_file(set_path + '.tar',
+                                              os.path.join(self.staging_folder, self.set_folder_name + '.tar'))
+            self.set_package = TarPackage(target,
+                                          self.set_folder_name,
+                                          bagit=self.options.package == 'bagit',
+                                          algorithms=self.checksum_algorithms,
+                                          spool_folder=self.staging_folder)
+            logger.info(f'Created package {self.set_folder_name}.tar.')
+            # goes into the package when the set is done
+            manifest_folder = staging_set_path
+        else:
+            self.storage.create_folder(set_path)
+            logger.info(f'Created folder {self.set_folder_name}.')
+            # an object can not be appended to, the manifest is uploaded when the set is done
+            manifest_folder = set_path if self.storage.is_local else staging_set_path
+
+        if self.options.manifest == 'set':
+            self.set_manifest = SetManifest(os.path.join(manifest_folder, manifest_name), self.checksum_algorithms)
+
+    def close_set_package(self):
+
+        """Completes the package of the current set and moves it into the download folder."""
+
+        if len(self.set_package):
+            if self.set_manifest is not None:
+                self.set_package.add_tag_file(manifest_name, self.set_manifest.path)
+            self.set_package.close()
+            logger.info(f'Wrote package {self.set_package.path} with {len(self.set_package)} SIPs.')
+        else:
+            self.set_package.discard()
+            logger.info(f'No SIPs for package {self.set_folder_name}.tar, not writing it.')
+        self.set_package = None
+        if self.set_manifest is not None:
+            os.remove(self.set_manifest.path)     # a copy is in the package
+
+    def make_article(self, record_id):
+
+        """Returns the state of a new retrieval of a record of the current set."""
+
+        article = Article(record_id, self.options.articledeadline)
+        location = sip_location(record_id, self.options.layout)
+        article.relative_path = '/'.join(location)
+
+        # the SIP is built in the staging area and only shows up in the set folder when complete
+        staging_set_path = os.path.join(self.staging_folder, self.set_folder_name)
+        if self.options.package == 'none':
+            article.sip = self.storage.folder_sip(os.path.join(staging_set_path, article.folder_name),
+                                                  self.storage.join(self.set_folder_name, *location),
+                                                  self.checksum_algorithms)
+        else:
+            # in a set package, the SIP folders follow the layout, too
+            article.sip = PackagedSip(article.relative_path if self.set_package is not None else article.folder_name,
+                                      staging_set_path,
+                                      self.storage.join(self.set_folder_name, *location) + '.tar',
+                                      package=self.set_package,
+                                      bagit=self.options.package == 'bagit',
+                                      algorithms=self.checksum_algorithms,
+                                      storage=self.storage)
+        return article
+
+    def create_article_folder(self, article):
+
+        """Creates a subfolder for a given article in the staging area."""
+
+        article.sip.create()
+        logger.info(f'Created subfolder {article.folder_name}.')
+
+    def commit_article(self, article):
+
+        """
+        Moves a complete SIP from the staging area into the set folder (or its
+        package), with the checksums of its files in the manifest of the SIP or the set.
+        """
+
+        checksums = sorted(article.checksums, key=lambda entry: entry[0])
+        if self.options.manifest == 'sip':
+            article.sip.write(manifest_name,
+                              (manifest_header(self.checksum_algorithms) +
+                               manifest_lines(self.checksum_algorithms, checksums)).encode('utf-8'))
+        article.sip.commit()
+        logger.debug(f'Moved {article.folder_name} from staging area to {article.sip.path}.')
+        if self.set_manifest is not None:
+            self.set_manifest.add(article.relative_path, checksums)
+
+    def handle_duplicate(self, article, first_sip_path, first_set):
+
+        """Links to (or skips) a record that already has a SIP from another set."""
+
+        if self.options.duplicates == 'link' and article.sip.can_link:
+            os.makedirs(os.path.dirname(article.sip.path), exist_ok=True)     # shard folder
+            os.symlink(os.path.relpath(first_sip_path, os.path.dirname(article.sip.path)), article.sip.path)
+            logger.info(f'Record was already processed for set {first_set}. Linked to existing SIP. ---')
+        else:
+            logger.info(f'Record was already processed for set {first_set}. Skipping. ---')
+
+        with self.state_lock:
+            overlap = self.set_overlap.setdefault(self.oai_set, {})
+            overlap[first_set] = overlap.get(first_set, 0) + 1
+
+    def save_oai_record(self, article, record):
+
+        """Writes OAI record to file."""
+
+        article.sip.write('oai-record.xml', record.raw.encode('utf-8'))
+        logger.info('Writing OAI PMH record.')
+
+    def abort(self, article):
+
+        """Delete the remains of a failed article retrieval from the staging area."""
+
+        if article.cancelled.is_set():
+            return      # the watchdog took care of it, the folder may already belong to a new attempt
+        logger.debug(f'Discarding SIP {article.folder_name} in staging area.')
+        article.sip.discard(onerror=report_rmtree_fail)
+
+    def retry_later(self, current_record_id, backoff=True):
+
+        """Schedules the current record id for the next round, so it gets processed again."""
+
+        with self.state_lock:
+            attempts = self.retry_attempts.get(current_record_id, 0) + 1
+            self.retry_attempts[current_record_id] = attempts
+
+        if backoff:
+            time.sleep(2*attempts)
+
+        if attempts > 3:
+            self.give_up(current_record_id)
+            logger.error('Multiple attempts to retrieve this article have failed. Giving up. ---')
+        else:
+            self.retry_record_ids.append(current_record_id)
+            logger.info('Will retry to retrieve article later. Skipping for now. ---')
+
+    def give_up(self, current_record_id):
+
+        """Adds the current record id to the failed downloads of the set."""
+
+        with self.state_lock:
+            if self.oai_set not in self.failed_record_ids:
+                self.failed_record_ids[self.oai_set] = [current_record_id]
+            elif current_record_id not in self.failed_record_ids[self.oai_set]:    # may come from the watchdog, too
+                self.failed_record_ids[self.oai_set].append(current_record_id)
+
+    def http_get(self, url, **kwargs):
+
+        """GET with the shared session that respects the request rate limit."""
+
+        self.request_limiter.acquire()
+        return self.http_session.get(url, **kwargs)
+
+    def http_head(self, url, **kwargs):
+
+        """HEAD with the shared session that respects the request rate limit."""
+
+        self.request_limiter.acquire()
+        return self.http_session.head(url, **kwargs)
+
+    def fetch_article_page(self, article):
+
+        """Retrieves the article page. With '--hedge', slow requests are sent a second time."""
+
+        timeout = article.deadline.timeout(self.phase_timeouts['page'])
+
+        def timed_get():
+            self.request_limiter.acquire()      # hedges count against the rate limit, too
+            start = time.monotonic()
+            response = self.http_session.get(article.url, timeout=timeout)
+            self.page_latency.add(time.monotonic() - start)
+            return response
+
+        if not self.options.hedge:
+            return timed_get()
+
+        page, hedge_sent, hedge_won = hedged_call(self.hedge_executor,
+                                                  timed_get,
+                                                  self.page_latency.percentile(self.hedge_percentile),
+                                                  discard=lambda late_page: late_page.close())
+        with self.state_lock:
+            self.hedge_statistics['requests'] += 1
+            self.hedge_statistics['hedged'] += hedge_sent
+            self.hedge_statistics['won'] += hedge_won
+        if hedge_sent:
+            logger.debug(f'Sent hedge request for slow article page, hedge answered first: {hedge_won}.')
+        return page
+
+    def report_hedging(self):
+
+        """Logs how many article page requests were hedged and how often the hedge was faster."""
+
+        threshold = self.page_latency.percentile(self.hedge_percentile)
+        threshold_text = f'{threshold:.2f} s' if threshold is not None else 'not reached'
+        logger.info(f'Hedged requests: {self.hedge_statistics["hedged"]} of {self.hedge_statistics["requests"]} '
+                    f'article page requests were hedged (current p{self.hedge_percentile} latency {threshold_text}), '
+                    f'the hedge answered first in {self.hedge_statistics["won"]} cases.')
+
+    def log_bandwidth_change(self, rate):
+
+        """Reports a new bandwidth limit read from the --bandwidthfile."""
+
+        if rate is None:
+            logger.warning(f'Could not read a bandwidth from {self.options.bandwidthfile}. Keeping the current limit.')
+        elif rate == 0:
+            logger.info('Bandwidth limit lifted.')
+        else:
+            logger.info(f'Bandwidth limit set to {rate:g} KiB/s.')
+
+    def run_cpu_task(self, article, stage, function, *args):
+
+        """
+        Runs a CPU heavy function, in the process pool with '--cpuworkers' or
+        else in the calling thread. Its time is added to the statistics of the stage.
+        """
+
+        start_time = time.monotonic()
+        if self.cpu_executor is None:
+            result = function(*args)
+        else:
+            future = self.cpu_executor.submit(function, *args)
+            while True:
+                try:
+                    result = future.result(timeout=1)
+                    break
+                except FutureTimeout:
+                    article.progress()      # a full pool must not look like a stalled worker
+        duration = time.monotonic() - start_time
+
+        with self.state_lock:
+            stage_time = self.cpu_stage_times.setdefault(stage, [0, 0.0])
+            stage_time[0] += 1
+            stage_time[1] += duration
+        return result
+
+    def report_cpu_stages(self):
+
+        """Logs the mean time articles spent in the CPU heavy stages, to compare runs with and without '--cpuworkers'."""
+
+        where = f'in {self.options.cpuworkers} worker processes' if self.cpu_executor is not None else 'in the article workers'
+        stages = ', '.join(f'{stage} {total / count * 1000:.1f} ms ({count} times)'
+                           for stage, (count, total) in self.cpu_stage_times.items())
+        logger.info(f'Mean time per article of the CPU heavy stages {where}: {stages}.')
+
+    def parse_article_page(self, article, article_page):
+
+        """Reads metadata, license and ISSN from the article page into the article. Returns the download links."""
+
+        from hinjodl.page_parsing import extract_page_data
+
+        page_data = self.run_cpu_task(article, 'page parsing', extract_page_data, article_page.content, article_page.encoding)
+
+        article.page_dc = page_data['dc']
+        article.license_string = self.get_license_information(article, page_data['license'])
+        article.issn_string = self.get_issn(article, page_data['issn'])
+
+        link_count = len(page_data['links'])
+        if link_count == 0:
+            logger.error('Could not get any download links from article web site.')
+        else:
+            logger.info(f'Extracted {link_count} unique download links from article web site.')
+        return page_data['links']
+
+    def get_license_information(self, article, license):
+
+        """Checks the link to the CC License read from the article page."""
+
+        if license is None:
+            logger.error('Could not scrape license information from website.')
+            license = 'HinJoDL: Missing license information.'
+            return license
+
+        if license:
+            logger.debug(f'Found license string in {article.page_url}.')
+            return license
+        else:
+            logger.error(f'Could not extract license attribute from element in {article.page_url}.')
+            license = 'HinJoDL: Missing license information.'
+            return license
+
+    def get_issn(self, article, issn):
+
+        """Checks the ISSN read from the article page."""
+
+        if issn:
+            logger.debug(f'Found ISSN in {article.page_url}.')
+            return issn
+        else:
+            logger.error(f'Could not find ISSN in {article.page_url}.')
+
+    def make_xml_output(self, article, current_record):
+
+        """Translates oai record and other sources to custom xml records."""
+
+        from hinjodl.metadata_mapping import make_xml_documents
+
+        harvest_timestamp = datetime.datetime.today()
+        documents, article.publisher_string, missing_tags = self.run_cpu_task(article,
+                                                                              'metadata',
+                                                                              make_xml_documents,
+                                                                              current_record.raw,
+                                                                              article.license_string,
+                                                                              article.issn_string,
+                                                                              self.oai_set,
+                                                                              article.record_id,
+                                                                              self.version,
+                                                                              self.base_url,
+                                                                              harvest_timestamp.strftime('%Y-%m-%d %H:%M:%S'))
+
+        # any mandatory tags missing?
+        for tag in missing_tags:
+            logger.warning(f'Could not find mandatory DC element {tag} in oai record.')
+
+            # cases go to a temporary file right away, see report_missing_metadata()
+            title = article.page_dc.get('dc.title', [''])[0] or ''
+            title = ' '.join(title.split())
+            with self.state_lock:
+                self.missing_md.write(f'{tag}\t{article.url}\t{title}\n')
+
+            tag_web_dc = tag.replace(':', '.')
+            if tag_web_dc in article.page_dc:
+                logger.info(f'Dublin Core metadata on article page suggests {tag} is {article.page_dc[tag_web_dc]}.')
+
+        # write output
+        for filename, content in documents.items():
+            article.sip.write(filename, content)
+
+        logger.info('Writing XML output.')
+
+    def receive_chunks(self, article, response):
+
+        """
+        Yields the body of a streamed response in chunks, enforcing deadline,
+        minimum throughput and the bandwidth limit.
+        """
+
+        guard = ThroughputGuard(self.options.minthroughput * 1024, self.throughput_grace_period)
+        received_bytes = 0
+        for chunk in response.iter_content(chunk_size=self.download_chunk_size):
+            throttled = self.bandwidth_limiter.acquire(len(chunk))
+            if throttled:
+                article.deadline.extend(throttled)
+            article.progress()
+            received_bytes += len(chunk)
+            guard.update(received_bytes, throttled)
+            yield chunk
+
+    def download_article_files(self, article, links):
+
+        """Iterates over a list of URLs and saves the contents. Returns False if a download failed."""
+
+        all_downloaded = True
+
+        for link in links:
+            article.progress()
+            try:
+                article_file = self.http_get(link,
+                                             stream=True,
+                                             timeout=article.deadline.timeout(self.phase_timeouts['file']))
+            except requests.exceptions.RequestException as exception:
+                logger.warning(f'Failed to download {link}. Exception from requests module: {exception}')
+                if not retry_download(links, link):
+                    all_downloaded = False
+                continue
+
+            if not article_file.ok:
+                current_http_error = article_file.status_code
+                article_file.close()
+                logger.warning(f'Failed to download {link}. HTTP status code {current_http_error}.')
+                if not retry_download(links, link):
+                    all_downloaded = False
+                continue
+
+            filename = link.split('/')[-1]
+            current_folder = 'MASTER'
+            file_type = 'article'
+
+            # write appendices to subfolder
+            if re.match(appendix_pattern, filename):
+                file_type = 'supplemental'
+                logger.info(f'Supplemental file detectet: {link}.')
+                current_folder = 'MASTER/supplements'
+                article.supplementary_materials_exist = True
+            member_name = f'{current_folder}/{filename}'
+
+            # write file while it comes in, hashing (see hinjodl.checksums) and checking along the way
+            check = StreamCheck(filename, get_expected_length(article_file),
+                                article_pdf=file_type == 'article' and bool(re.match(article_pdf_pattern, filename)))
+            logger.info(f'Writing {file_type} file {filename}.')
+            try:
+                with article_file, article.sip.open(member_name) as file:
+                    for chunk in self.receive_chunks(article, article_file):
+                        file.write(chunk)
+                        check.update(chunk)
+            except (TransferStalled, requests.exceptions.RequestException) as exception:
+                logger.warning(f'Download of {link} interrupted: {exception}')
+                article.sip.remove(member_name)
+                if not retry_download(links, link):
+                    all_downloaded = False
+                continue
+
+            for level, message in check.finish():
+                logger.log(level, message)
+            if not check.complete:
+                article.sip.remove(member_name)
+                if not retry_download(links, link):
+                    all_downloaded = False
+                continue
+            if not check.valid:
+                article.sip.remove(member_name)
+                with self.state_lock:
+                    article.rejected_files.append(filename)
+                continue
+            if file_type == 'article' and re.match(article_pdf_pattern, filename):
+                article.article_pdf_found = True
+
+            # checksums go to the manifest on commit, or to sidecar files in the legacy layout
+            if self.options.manifest == 'sidecar':
+                for algorithm in self.checksum_algorithms:
+                    article.sip.write(f'{member_name}.{algorithm}',
+                                      sidecar_content(filename, algorithm, file.digest).encode('utf-8'))
+                logger.debug(f'Writing checksums for {filename}.')
+            else:
+                with self.state_lock:
+                    article.checksums.append((member_name, file.digest))
+
+        return all_downloaded
+
+    def get_content_length(self, article, link):
+
+        """Asks for the size of a file with a HEAD request. Returns None if the size is unknown."""
+
+        try:
+            response = self.http_head(link,
+                                      allow_redirects=True,
+                                      timeout=article.deadline.timeout(self.phase_timeouts['file']))
+        except requests.exceptions.RequestException:
+            return None
+        content_length = response.headers.get('Content-Length', '')
+        if response.ok and content_length.isdigit():
+            return int(content_length)
+        return None
+
+    def split_large_files(self, article, links):
+
+        """
+        Returns the links of an article as (small files, large files). Only
+        supplements can be large, their sizes are checked ahead of time.
+        """
+
+        small_links = []
+        large_links = []
+        for link in links:
+            if self.options.largefile and re.match(appendix_pattern, link.split('/')[-1]):
+                size = self.get_content_length(article, link)
+                if size is not None and size > self.options.largefile * 1024**2:
+                    logger.info(f'Large supplemental file ({size / 1024**2:.1f} MiB), handing it to the large file lane: {link}.')
+                    # the deadline must not cut off a transfer that keeps the minimum throughput
+                    if self.options.minthroughput:
+                        article.deadline.extend(size / (self.options.minthroughput * 1024))
+                    large_links.append(link)
+                    continue
+            small_links.append(link)
+        return small_links, large_links
+
+    def download_large_file(self, article, link, queued):
+
+        """Task of the large file lane: downloads one file, the last part of an article to finish completes it."""
+
+        set_log_context(self.oai_set, article.record_id)
+        article.deadline.extend(time.monotonic() - queued)     # waiting for a free lane does not count
+        try:
+            downloaded = self.download_article_files(article, [link])
+        except Exception:
+            logger.exception(f'Unexpected error while downloading {link}.')
+            downloaded = False
+
+        try:
+            self.finish_download_part(article, downloaded)
+        except Exception:
+            logger.exception(f'Unexpected error while processing record {article.record_id}.')
+            self.abort(article)
+            self.retry_later(article.record_id)
+
+    def finish_download_part(self, article, downloaded):
+
+        """
+        Counts a finished part of the downloads of an article: the small files,
+        or a single large file. Once all parts are in, the article is completed.
+        """
+
+        with self.state_lock:
+            article.all_downloaded = article.all_downloaded and downloaded
+            article.pending_parts -= 1
+            if article.pending_parts:
+                return
+
+        if not article.all_downloaded:
+            self.retry_later(article.record_id)
+            self.abort(article)
+            return
+
+        # files were checked while they came in, see download_article_files()
+        if article.rejected_files:
+            self.give_up(article.record_id)
+            logger.error(f'Not adding SIP with invalid files to set folder: {", ".join(article.rejected_files)}. ---')
+            self.abort(article)
+            return
+        if not article.article_pdf_found:
+            self.give_up(article.record_id)
+            logger.error(f'The article PDF file seems missing for OAI record {article.record_id}.')
+            logger.error('Not adding SIP without article PDF to set folder. ---')
+            self.abort(article)
+            return
+
+        article.progress()      # a cancelled article must not end up in the set folder
+        self.commit_article(article)
+        self.page_extracts.save(article.record_id, article.page_extracts)
+        self.seen_records.add(article.record_id, self.storage.location(article.sip.path), self.oai_set)
+        if self.watch_state is not None:
+            with self.state_lock:
+                self.poll_record_ids.add(article.record_id)
+        self.mark_processed(article)
+
+        logger.info(f'Processed article {article.record_id}. ---')
+
+    def rebuild_metadata(self, folder):
+
+        """Regenerates the XML metadata of all SIPs in a folder, in parallel and without network access."""
+
+        from hinjodl.metadata_mapping import rebuild_sip_metadata
+
+        rebuild_workers = self.options.rebuildworkers
+        logger.info(f'Rebuilding metadata of SIPs in {folder} with {rebuild_workers or os.cpu_count()} processes.')
+
+        sip_folders = list(find_sip_folders(folder))
+        logger.info(f'Found {len(sip_folders)} SIPs.')
+
+        rebuilt_count = 0
+        with ProcessPoolExecutor(max_workers=rebuild_workers or None) as executor:
+            results = executor.map(rebuild_sip_metadata,
+                                   sip_folders,
+                                   [self.page_extracts_cache] * len(sip_folders),
+                                   [self.page_extracts_folder] * len(sip_folders),
+                                   [self.version] * len(sip_folders),
+                                   [self.base_url] * len(sip_folders),
+                                   chunksize=64)
+            for sip_folder, missing_tags, error in results:
+                if error:
+                    logger.error(f'Could not rebuild metadata of {sip_folder}: {error}')
+                    continue
+                rebuilt_count += 1
+                for tag in missing_tags:
+                    logger.warning(f'Could not find mandatory DC element {tag} in oai record of {sip_folder}.')
+
+        logger.info(f'Rebuilt metadata of {rebuilt_count} of {len(sip_folders)} SIPs.')
+
+    def write_unfinished_ids(self, id_list):
+
+        "Writes yet to be processed OAI PMH record ids to file."
+
+        filename = f'{self.timestamp}_remaining_OAI_record_ids.txt'
+        self.unfinished_ids_written = time.monotonic()
+        if id_list:
+            logger.info(f'Writing list of {str(len(id_list))} remaining record ids.')
+            id_list = '\n'.join(id_list)
+            with open(filename, 'w') as rec_file:
+                rec_file.writelines(id_list)
+        elif os.path.isfile(filename):
+            logger.info('Deleting now empty list of unprocessed record ids.')
+            os.remove(filename)
+
+    def write_oai_statistics(self, oai_stats):
+
+        """Writes set metrics gathered via OAI PMH in a CSV file."""
+
+        with open(f'{self.timestamp}_counted_records.csv', 'w') as csv_file:
+            csvwriter = csv.writer(csv_file)
+            for journal in sorted(oai_stats):
+                csv_file.write('\n')
+                csvwriter.writerow([self.journal_titles[journal]])
+                csvwriter.writerow(oai_stats[journal])
+                csvwriter.writerow(oai_stats[journal].values())
+
+        logger.info('Wrote record counts reported by OAI PMH interface to csv file.')
+
+    def report_set_overlap(self):
+
+        """Writes the number of records per set that were already processed for another set to a CSV file."""
+
+        with open(f'{self.timestamp}_set_overlap.csv', 'w') as csv_file:
+            csvwriter = csv.writer(csv_file)
+            csvwriter.writerow(['set', 'first processed in set', 'records'])
+            for current_set, overlap in self.set_overlap.items():
+                for first_set, count in overlap.items():
+                    csvwriter.writerow([current_set, first_set, count])
+                    logger.info(f'{count} records of set {current_set} were already processed for set {first_set}.')
+
+        logger.info('Wrote overlap between sets to csv file.')
+
+    def report_missing_metadata(self):
+
+        """Write context info about missing metadata cases to text file."""
+
+        from hinjodl.metadata_mapping import mandatory_tags
+
+        logger.info('Writing report on missing metadata.')
+
+        with open(f'{self.timestamp}_missing_metadata.txt', 'a') as report_file:
+            report_file.write(f'=== {self.oai_set}\n')
+            report_file.write('\n')
+            # one pass over the cases per tag, the cases themselves stay on disk
+            for tag in mandatory_tags:
+                self.missing_md.seek(0)
+                header_written = False
+                for line in self.missing_md:
+                    missing_tag, id, title = line.rstrip('\n').split('\t')
+                    if missing_tag != tag:
+                        continue
+                    if not header_written:
+                        report_file.write(f'Das Dublin Core Element {tag} fehlt bei folgenden DOIs:\n')
+                        header_written = True
+                    report_file.write('---\n')
+                    report_file.write('\n')
+                    report_file.write(f'{id}\n')
+                    report_file.write(f"Titel: {title}\n")
+                    report_file.write('\n')
+
+    def report_failed_downloads(self, failed_oai_ids):
+
+        """Export a list of record IDs whose retrieval ultimately failed."""
+
+        logger.info('Writing report on failed download attempts.')
+
+        with open(f'{self.timestamp}_failed_downloads.txt', 'a') as id_file:
+            id_file.write(f'{self.oai_set}\n')
+            for oai_id in failed_oai_ids[self.oai_set]:
+                id_file.write(f'"{oai_id}" ')
+            id_file.write('\n')
+            id_file.write('\n')
+
+    def track_title_madness(self, article):
+
+        """Appends a file with journal title strings from different sources.
+         Temporary function, remove later."""
+
+        # hint: 'sort -u title_string_tracking.txt | wc -l' is very close to
+        # to the number of downloaded articles.
+
+        self.title_tracking.write(f'{self.oai_set}, {article.record_id}, {self.journal_titles[self.journal_set]}, '
+                                  f'{article.publisher_string}\n')
+
+    def mark_processed(self, article):
+
+        """Removes the article from the remaining record ids and marks it done in the checkpoint."""
+
+        # the list of remaining record ids is rewritten now and then, see harvest_set() for the last time
+        with self.state_lock:
+            del self.unprocessed_rec_ids[article.record_id]
+            if time.monotonic() - self.unfinished_ids_written >= self.unfinished_ids_interval:
+                self.write_unfinished_ids(list(self.unprocessed_rec_ids))
+        if self.listing_checkpoint is not None:
+            self.listing_checkpoint.mark_done(article.record_id)
+        if self.watch_state is not None:
+            self.watch_state.mark_processed(article.record_id)
+
+    def process_article(self, article):
+
+        """Retrieves OAI record, article page and article files, writes the output."""
+
+        logger.info(f'--- Working on record {article.record_id}.')
+
+        # SIPs only show up in the set folder when complete
+        if article.sip.exists():
+            logger.info('SIP already exists in set folder. Skipping. ---')
+            self.mark_processed(article)
+            return
+
+        # the same record may be listed in more than one set. An incremental
+        # listing in watch mode has changed records, too: only SIPs made in the
+        # current poll have the latest version.
+        if self.options.duplicates != 'download':
+            first_sip = self.seen_records.get(article.record_id)
+            if first_sip is not None and self.watch_state is not None and self.watch_state.from_date \
+                    and article.record_id not in self.poll_record_ids:
+                first_sip = None
+            if first_sip is not None:
+                self.handle_duplicate(article, *first_sip)
+                self.mark_processed(article)
+                return
+
+        # get OAI record
+        self.create_article_folder(article)
+        oai_record = self.sickle.GetRecord(identifier=article.record_id, metadataprefix='oai_dc')
+        self.save_oai_record(article, oai_record)
+
+        # get url for scraping content (this is usually a doi from dc:identifier)
+        article.url = oai_record.metadata.get('identifier', ['nobunny'])[0]
+        if article.url == 'nobunny':
+            logger.error('Could not get DOI from OAI record. Skipping. ---')
+            self.abort(article)
+            return
+        else:
+            logger.info(f'Extracted DOI from OAI record: {article.url}.')
+
+        # remap URL when URL lookup table is provided
+        if self.doi_url_map is not None:
+            mapped_url = self.doi_url_map.get(article.url)
+            if mapped_url:
+                article.url = mapped_url
+
+        # retrieve article web site (follows redirect by default)
+        article.progress()
+        try:
+            article_page = self.fetch_article_page(article)
+        except requests.exceptions.RequestException as exception:
+            logger.warning(f'Failed to get article page. Exception from requests module: {exception}')
+            self.retry_later(article.record_id)
+            self.abort(article)
+            return
+
+        if not article_page.ok:
+            http_error = article_page.status_code
+            logger.warning(f'Could not retrieve article page. HTTP status code {http_error}.')
+            self.retry_later(article.record_id)
+            self.abort(article)
+            return
+
+        if 'hindawi.com' not in article_page.url:
+            logger.error(f'The DOI points to a third party source: {article_page.url}. Skipping. ---')
+            self.abort(article)
+            return
+
+        article.page_url = article_page.url
+        logger.info(f'Retrieved article web site {article_page.url}.')
+
+        download_links = self.parse_article_page(article, article_page)
+        article.page_extracts = {'url': article.url,
+                                 'page_url': article.page_url,
+                                 'license': article.license_string,
+                                 'issn': article.issn_string,
+                                 'dc': article.page_dc}
+        self.make_xml_output(article, oai_record)
+        self.track_title_madness(article)     # temporary hack (remove function, clean make_xml_output)
+
+        # large supplements go to their own lane, so they do not hold up the worker
+        download_links, large_links = self.split_large_files(article, download_links)
+        article.pending_parts = 1 + len(large_links)
+        for link in large_links:
+            self.large_file_tasks.append(self.large_file_executor.submit(self.download_large_file, article, link,
+                                                                         time.monotonic()))
+
+        self.finish_download_part(article, self.download_article_files(article, download_links))
+        if large_links:
+            logger.info(f'Downloaded small files, article is completed once its {len(large_links)} large files are in.')
+
+    def article_worker(self, id_queue):
+
+        """Consumer: processes record IDs from the queue until told to stop."""
+
+        worker = threading.current_thread()
+        set_log_context(self.oai_set)
+
+        while worker not in self.abandoned_workers:
+            record_id = id_queue.get()
+            if record_id is None:
+                return
+            if self.stop_event.is_set():
+                continue        # left for the next run, see stop()
+
+            set_log_context(record_id=record_id)
+            article = self.make_article(record_id)
+            watchdog = self.watchdog
+            if watchdog is not None:
+                watchdog.watch(worker, article)
+            try:
+                self.process_article(article)
+            except Exception as exception:
+                # a worker thread must not die, the record gets another chance instead
+                if not article.cancelled.is_set():
+                    if isinstance(exception, DeadlineExceeded):
+                        logger.warning(f'Record {record_id} took longer than {self.options.articledeadline} seconds.')
+                    else:
+                        logger.exception(f'Unexpected error while processing record {record_id}.')
+                    self.abort(article)
+                    self.retry_later(record_id)
+            finally:
+                if watchdog is not None:
+                    watchdog.forget(worker)
+            if article.cancelled.is_set():
+                # the watchdog re-queues the record and clears its staging folder, a new worker takes over
+                logger.warning(f'Stopped working on cancelled record {record_id}. ---')
+                return
+
+    def start_worker(self, id_queue):
+
+        """Starts an article worker thread and returns it."""
+
+        with self.state_lock:
+            self.worker_count += 1
+            worker_number = self.worker_count
+        worker = threading.Thread(target=self.article_worker,
+                                  args=(id_queue,),
+                                  name=f'worker-{worker_number}',
+                                  daemon=True)     # a hanging worker must not keep the program alive
+        worker.start()
+        return worker
+
+    def replace_stalled_worker(self, worker, article, id_queue, workers):
+
+        """
+        Called by the watchdog for a worker without progress: re-queues its record
+        and starts a fresh worker in its place.
+
+        The stalled thread can not be killed. It is left behind and stops as soon
+        as it returns from whatever blocks it, without taking another record.
+        """
+
+        logger.warning(f'No progress on record {article.record_id} in {worker.name} '
+                       f'for {self.options.stalltimeout} seconds. Handing the record over to a new worker.')
+
+        # first of all, so the stalled thread takes no other record if it returns now.
+        # run_article_pipeline() waits for this function, there is no gap without a live worker.
+        with self.state_lock:
+            self.abandoned_workers.add(worker)
+        self.retry_later(article.record_id, backoff=False)
+        workers.append(self.start_worker(id_queue))
+
+        # the stalled thread may still write to open files, the writer moves them out of the way
+        article.sip.discard(onerror=report_rmtree_fail)
+
+    def feed_record_ids(self, record_ids, id_queue, worker_count):
+
+        """Producer: puts record IDs into the queue as they come in, then stops the workers."""
+
+        set_log_context(self.oai_set)
+        try:
+            for record_id in record_ids:
+                if self.stop_event.is_set():
+                    logger.info('Stopping: no more records are started, finishing those in progress.')
+                    break
+                # an incremental listing in watch mode only has new or changed records
+                if self.archive_inventory is not None and record_id in self.archive_inventory \
+                        and not (self.watch_state is not None and self.watch_state.from_date):
+                    logger.debug(f'Record {record_id} is already downloaded or ingested. Skipping.')
+                    with self.state_lock:
+                        self.archived_records[self.oai_set] = self.archived_records.get(self.oai_set, 0) + 1
+                    continue
+                with self.state_lock:
+                    self.unprocessed_rec_ids[record_id] = None
+                id_queue.put(record_id)         # blocks while the workers are busy
+        except Exception:
+            logger.exception(f'Listing the record IDs of set {self.oai_set} failed. Processing the IDs received so far.')
+        finally:
+            for worker in range(worker_count):
+                id_queue.put(None)
+
+    def run_article_pipeline(self, record_ids):
+
+        """
+        Processes records while the record IDs are still coming in.
+
+        A producer thread pages through the ID listing and feeds a bounded queue,
+        several article workers consume it at the same time. The first download
+        starts after the first ListIdentifiers page, and memory stays bounded no
+        matter how large the set is. Records to be retried are collected in
+        retry_record_ids for the next round.
+        """
+
+        id_queue = queue.Queue(maxsize=self.record_queue_size)
+        parallel_workers = max(1, self.options.workers)
+        workers = []
+
+        if self.options.stalltimeout:
+            self.watchdog = StallWatchdog(self.options.stalltimeout,
+                                          lambda worker, article: self.replace_stalled_worker(worker, article,
+                                                                                             id_queue, workers),
+                                          interval=min(5, self.options.stalltimeout))
+            self.watchdog.start()
+
+        producer = threading.Thread(target=self.feed_record_ids,
+                                    args=(record_ids, id_queue, parallel_workers),
+                                    name='producer')
+        producer.start()
+        for worker_number in range(parallel_workers):
+            workers.append(self.start_worker(id_queue))
+
+        producer.join()
+        # replacement workers may be added while we wait, abandoned ones are not waited for.
+        # A stall being handled re-queues its record and starts a replacement, wait for that, too.
+        while True:
+            with self.state_lock:
+                remaining = [worker for worker in workers
+                             if worker.is_alive() and worker not in self.abandoned_workers]
+            if remaining:
+                remaining[0].join(timeout=1)
+            elif self.watchdog is not None and self.watchdog.busy():
+                time.sleep(0.1)
+            else:
+                break
+
+        # articles with large files are completed by the large file lane
+        wait(self.large_file_tasks)
+        self.large_file_tasks.clear()
+
+        if self.watchdog is not None:
+            self.watchdog.stop()
+            self.watchdog = None
+
+    def read_set_list(self):
+
+        """Returns the sets to work on: the given set or the sets in the given setfile."""
+
+        if os.path.isfile(self.options.oaiset):
+            oai_set_list = parse_setfile(self.options.oaiset)
+        else:
+            oai_set_list = [self.options.oaiset]
+        logger.debug(f'OAI set list is now {oai_set_list}.')
+        return oai_set_list
+
+    def open_run(self, enable_download):
+
+        """Reads the config file, opens stores, executors and the OAI-PMH harvester, prepares the download folder."""
+
+        options = self.options
+
+        # read the config file
+        self.download_destination = get_download_path(self.config_file)
+        self.storage = open_download_storage(self.download_destination, options.s3endpoint, options.uploadworkers)
+
+        # create url lookup table if given
+        if options.urllut:
+            self.doi_url_map = open_url_lookup_table(options.urllut)
+
+        # records turned into SIPs, in this run and (with --seenindex) earlier ones
+        self.seen_records = SeenRecords(options.seenindex)
+        if enable_download:
+            self.page_extracts = PageExtractCache(self.page_extracts_cache)
+
+        self.large_file_executor = ThreadPoolExecutor(max_workers=max(1, options.largeworkers),
+                                                      thread_name_prefix='large')
+        if options.hedge:
+            # the slower request of a pair keeps running in the background until it times out
+            self.hedge_executor = ThreadPoolExecutor(max_workers=4 * max(1, options.workers),
+                                                     thread_name_prefix='page')
+
+        if options.cpuworkers and enable_download:
+            # page parsing and XML generation, see run_cpu_task(). Spawned, not
+            # forked: other threads (logging) are running already.
+            self.cpu_executor = ProcessPoolExecutor(max_workers=options.cpuworkers,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+
+        # connections are kept open and reused by all threads
+        self.http_session = requests.Session()
+        pool_size = max(1, options.workers) + max(1, options.largeworkers)
+        if options.hedge:
+            pool_size += 4 * max(1, options.workers)
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+        self.http_session.mount('https://', adapter)
+        self.http_session.mount('http://', adapter)
+
+        # initialize oai pmh harvester
+        self.request_limiter = TokenBucket(options.rate)
+        self.bandwidth_limiter = TokenBucket(options.bandwidth * 1024)
+        if options.bandwidthfile:
+            self.bandwidth_watcher = RateFileWatcher(options.bandwidthfile,
+                                                     self.bandwidth_limiter,
+                                                     scale=1024,
+                                                     on_change=self.log_bandwidth_change)
+            self.bandwidth_watcher.poll()
+            self.bandwidth_watcher.start()
+        self.sickle = self.open_sickle()
+
+        if self.storage.is_local:
+            self.create_download_folder(self.download_destination)
+        self.staging_folder = os.path.join(self.storage.staging_root, f'{self.timestamp}_{os.getpid()}')
+        self.clean_staging_area()
+
+        # records in the download folder or already ingested are skipped before any request for them
+        if options.inventory and enable_download:
+            self.inventory_roots = ([self.download_destination] if self.storage.is_local else []) + options.ingested
+            self.archive_inventory = ArchiveInventory(options.inventory)
+
+    def update_archive_inventory(self):
+
+        """Brings the inventory of downloaded and ingested SIPs up to date, reading only changed set folders."""
+
+        changed = self.archive_inventory.update(self.inventory_roots)
+        if changed:
+            logger.info(f'Updated archive inventory: read {changed} new or changed set folders, '
+                        f'{len(self.archive_inventory)} records downloaded or ingested.')
+        else:
+            logger.debug('Archive inventory is up to date.')
+
+    def prepare_set(self, oai_set, custom_records=None, record_counts=None):
+
+        """Looks up the journal title of a set and puts the known record counts in the statistics."""
+
+        journal_set = self.journal_set = oai_set.split(':')[0]
+
+        # get journal title if necessary
+        if journal_set not in self.journal_titles:
+            self.journal_titles[journal_set] = self.get_journal_title(journal_set)
+
+        # count records in set or subset, put in stats
+        if journal_set not in self.set_statistics:             # subdictionary
+            self.set_statistics[journal_set] = {}              # per journal
+        if custom_records is not None:
+            logger.info(f'Targeting only {len(custom_records)} given OAI records.')
+            self.set_statistics[journal_set][oai_set] = len(custom_records)
+        elif record_counts is not None:
+            # counted beforehand, no need for the identifiers themselves
+            self.set_statistics[journal_set][oai_set] = record_counts[oai_set]
+
+    def report_run(self, write_statistics=True):
+
+        """Cleans up the staging area, writes statistics and reports, sums up warnings and errors."""
+
+        # all SIPs are either committed or discarded by now
+        if os.path.isdir(self.staging_folder):
+            rmtree(self.staging_folder, onerror=report_rmtree_fail)
+
+        # export statistics
+        if write_statistics:
+            self.write_oai_statistics(self.set_statistics)
+        if self.set_overlap:
+            self.report_set_overlap()
+        if self.options.hedge:
+            self.report_hedging()
+        if self.cpu_stage_times:
+            self.report_cpu_stages()
+
+        # inform user when errors or warnings occurred
+        warning_count = self.log_counter.count(logging.WARNING) - self.log_counter.count(logging.ERROR)
+        error_count = self.log_counter.count(logging.ERROR)
+        if warning_count:
+            logger.info(f'-  THERE HAVE BEEN {warning_count} WARNINGS.  - Please check the logfile.')
+        if error_count:
+            logger.info(f'-  THERE HAVE BEEN {error_count} ERRORS.  - Please check the logfile.')
+
+    def harvest(self):
+
+        """Works through the given sets: makes setfiles, counts records and downloads articles."""
+
+        options = self.options
+
+        # get oai set list (or single set) from options
+        oai_set_list = self.read_set_list()
+        oai_set_list_original_length = len(oai_set_list)        # used for program logic
+
+        # determine program logic from options
+        custom_records = None
+        if options.oaiid:
+            if os.path.isfile(options.oaiid[0]):
+                custom_records = parse_record_list(options.oaiid[0])
+            else:
+                custom_records = options.oaiid
+
+        # is makesetfile used without countrecords?
+        only_make_setfile = bool(options.makesetfile) and not options.countrecords
+
+        # disable download when not desired
+        enable_download = not (options.countrecords or options.makesetfile)
+        if not enable_download:
+            logger.info('Article download in this run disabled.')
+
+        self.open_run(enable_download)
+
+        # in countrecords mode, add the subsets of given journals and count everything at once
+        record_counts = None
+        if options.countrecords:
+            for oai_set in oai_set_list[:oai_set_list_original_length]:
+                if analyze_set(oai_set) == 'set':
+                    oai_set_list.extend(self.get_subsets(oai_set))
+            if custom_records is None:
+                sets_to_count = [item for item in dict.fromkeys(oai_set_list) if analyze_set(item) != 'garbage']
+                record_counts = self.count_records_parallel(sets_to_count)
+
+        for set_index, oai_set in enumerate(oai_set_list, start=1):
+
+            self.oai_set = oai_set
+            set_log_context(oai_set)
+            logger.info(f'=== Working on set {oai_set[:32]}.')  # "set" >32 is definitely wrong input
+            set_type = analyze_set(oai_set)
+            if set_type == 'garbage':
+                logger.warning('Sorry, this does not look like a valid Hindawi set. Skipping.')
+                continue
+
+            if options.makesetfile and set_index <= oai_set_list_original_length:
+                if set_type == 'subset':
+                    logger.warning('Sorry, can not make a setfile from a subset. Skipping.')
+                    continue
+                else:
+                    subsets = self.get_subsets(oai_set)
+                    self.append_setfile(subsets)
+
+            if not only_make_setfile:
+                self.prepare_set(oai_set, custom_records, record_counts)
+
+            if enable_download:
+                self.harvest_set(custom_records)
+
+        self.report_run(write_statistics=not only_make_setfile)
+
+        logger.info('Parsed all given sets.\nDone.')
+
+    def stop(self):
+
+        """
+        Asks the harvest to stop: no new records are started, those in progress
+        are finished. Safe to call from other threads and signal handlers.
+        """
+
+        self.stop_event.set()
+
+    def handle_stop_signals(self):
+
+        """
+        Makes SIGTERM and SIGINT stop the harvest gracefully (see stop()).
+        A second signal has the usual effect. Returns the previous handlers.
+        """
+
+        previous_handlers = {}
+        if threading.current_thread() is not threading.main_thread():
+            return previous_handlers    # signal handlers can only be set in the main thread
+
+        def request_stop(signum, frame):
+            # no logging in here, the handler may interrupt the main thread inside a log call
+            for number, handler in previous_handlers.items():
+                signal.signal(number, handler)
+            self.stop()
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            previous_handlers[signum] = signal.signal(signum, request_stop)
+        return previous_handlers
+
+    def remove_empty_set_folder(self):
+
+        """Removes the folder of the current set if no SIP went into it (a set manifest may be there)."""
+
+        if self.storage.remove_empty_folder(self.storage.join(self.set_folder_name), ignore={manifest_name},
+                                              onerror=report_rmtree_fail):
+            logger.debug(f'Removed empty set folder {self.set_folder_name}.')
+
+    def watch(self):
+
+        """
+        Polls the given sets until stopped, each time for the records that are
+        new or changed since the last complete poll of the set. Connections,
+        stores, lookup tables and journal titles stay in memory in between.
+        Every poll gets its own timestamp, so its SIPs go into new set folders.
+        """
+
+        from hinjodl.oai import get_granularity
+
+        oai_set_list = []
+        for oai_set in self.read_set_list():
+            if analyze_set(oai_set) == 'garbage':
+                logger.warning(f'Sorry, {oai_set[:32]} does not look like a valid Hindawi set. Skipping.')
+            else:
+                oai_set_list.append(oai_set)
+
+        self.open_run(enable_download=True)
+        # 'from' dates have to match the datestamp granularity of the repository
+        if get_granularity(self.sickle) == 'YYYY-MM-DDThh:mm:ssZ':
+            date_format = '%Y-%m-%dT%H:%M:%SZ'
+        else:
+            date_format = '%Y-%m-%d'
+        interval = datetime.timedelta(minutes=self.options.watch)
+        logger.info(f'Watching {len(oai_set_list)} sets, polling every {self.options.watch:g} minutes. '
+                    'Stop with SIGTERM or Ctrl-C.')
+
+        previous_handlers = self.handle_stop_signals()
+        try:
+            while not self.stop_event.is_set():
+                poll_start = datetime.datetime.now(datetime.timezone.utc)
+                self.timestamp = datetime.datetime.today().strftime('%Y-%m-%d_%H-%M-%S')
+                self.poll_from_date = poll_start.strftime(date_format)
+                self.set_statistics = {}
+                self.set_overlap = {}
+                self.archived_records = {}
+                self.poll_record_ids = set()
+                changed_count = 0
+
+                for oai_set in oai_set_list:
+                    if self.stop_event.is_set():
+                        break
+                    self.oai_set = oai_set
+                    set_log_context(oai_set)
+                    logger.info(f'=== Polling set {oai_set}.')
+                    self.prepare_set(oai_set)
+                    if oai_set not in self.watch_states:
+                        self.watch_states[oai_set] = WatchState(self.checkpoint_folder, oai_set)
+                    watch_state = self.watch_states[oai_set]
+                    watch_state.changed_count = 0
+                    self.harvest_set(watch_state=watch_state)
+                    self.remove_empty_set_folder()
+                    changed_count += watch_state.changed_count
+                set_log_context('')
+
+                self.report_run(write_statistics=changed_count > 0)
+                poll_time = datetime.datetime.now(datetime.timezone.utc) - poll_start
+                logger.info(f'Poll done in {poll_time.total_seconds():.0f} seconds, '
+                            f'{changed_count} new or changed records, {len(self.poll_record_ids)} SIPs made.')
+
+                if not self.stop_event.is_set():
+                    next_poll = poll_start + interval
+                    logger.info(f'Next poll at {next_poll.astimezone():%Y-%m-%d %H:%M:%S}.')
+                    self.stop_event.wait((next_poll - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+        logger.info('Stopped watching as requested.\nDone.')
+
+    def harvest_set(self, custom_records=None, watch_state=None):
+
+        """
+        Downloads the records of the current set, or only the given ones.
+        With a watch state, only those that are new or changed (see watch()).
+        """
+
+        oai_set = self.oai_set
+
+        # SIPs may have been moved to the ingested folders since the last set or poll
+        if self.archive_inventory is not None:
+            self.update_archive_inventory()
+
+        self.create_set_folder(oai_set)
+        self.missing_md = tempfile.TemporaryFile('w+', encoding='utf-8')
+        logger.debug('Flushing missing metadata collection.')
+
+        # resume after crash -- track record ids that are listed, but not
+        # downloaded yet (ordered, dict used as set)
+        self.retry_attempts = {}
+        if custom_records is not None:
+            self.listing_checkpoint = None
+            self.unprocessed_rec_ids = dict.fromkeys(custom_records)
+            record_source = custom_records
+        else:
+            self.listing_checkpoint = ListingCheckpoint(self.checkpoint_folder, oai_set)
+            self.unprocessed_rec_ids = {}
+            self.watch_state = watch_state
+            record_source = self.list_identifiers(oai_set, self.listing_checkpoint, watch_state)
+
+        # records failing in one round are processed again in the next one
+        while record_source and not self.stop_event.is_set():
+            self.retry_record_ids = []
+            self.run_article_pipeline(record_source)
+            record_source = self.retry_record_ids
+
+        with self.state_lock:
+            self.write_unfinished_ids(list(self.unprocessed_rec_ids))
+        self.title_tracking.flush()
+
+        if oai_set in self.archived_records:
+            logger.info(f'Skipped {self.archived_records[oai_set]} records of set {oai_set} already downloaded or ingested.')
+
+        if custom_records is None:
+            self.set_statistics[self.journal_set][oai_set] = self.listed_record_count
+            # keep the checkpoint if the listing broke off, the next run continues from there
+            if self.stop_event.is_set():
+                logger.info(f'Stopped before set {oai_set} was done. Run again to continue from checkpoint.')
+            elif self.listing_checkpoint.complete:
+                self.listing_checkpoint.remove()
+            else:
+                logger.error(f'Listing of set {oai_set} is incomplete. Run again to continue from checkpoint.')
+            if watch_state is not None:
+                # the next poll lists what changed since this one started. After a
+                # resumed listing, the changes since then are still to be listed.
+                if self.listing_checkpoint.complete and not self.listing_checkpoint.resumed \
+                        and not self.stop_event.is_set():
+                    watch_state.advance(self.poll_from_date)
+                watch_state.save()
+                self.watch_state = None
+
+        if self.set_manifest is not None:
+            self.set_manifest.close()
+        if self.set_package is not None:
+            self.close_set_package()
+        elif self.set_manifest is not None and not self.storage.is_local:
+            if self.set_manifest.entry_count:
+                self.storage.store_file(self.set_manifest.path, self.storage.join(self.set_folder_name, manifest_name))
+            else:
+                os.remove(self.set_manifest.path)
+        self.set_manifest = None
+
+        if self.missing_md.tell():
+            self.report_missing_metadata()
+        self.missing_md.close()
+
+        if oai_set in self.failed_record_ids:
+            self.report_failed_downloads(self.failed_record_ids)
+            del self.failed_record_ids[oai_set]
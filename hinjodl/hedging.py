@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Hedged requests for the article page fetches of the downloader.
+#
+# Most Hindawi article pages answer in well under a second, a few take tens of
+# seconds. Often the slow answer is bad luck with a single connection, and the
+# same request sent again comes back quickly. With hedging, a request that did
+# not answer within the observed 95th percentile of the response times is
+# sent a second time, and whichever response arrives first is used. This
+# costs about 5 % additional requests and cuts off most of the long tail.
+
+
+import threading
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+
+
+class LatencyTracker:
+
+    """Response times of the most recent requests. Safe to share between threads."""
+
+    def __init__(self, window=200, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, percent):
+
+        """Returns the given percentile in seconds, None while there are too few samples."""
+
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
+
+
+def hedged_call(executor, function, delay, discard=None):
+
+    """
+    Calls function() and, if it did not return within delay seconds, calls it
+    a second time. The first successful result wins.
+
+    Returns (result, hedge_sent, hedge_won). Without a delay (None) function
+    is simply called. The slower call can not be stopped, its result is passed
+    to discard() once it arrives. If both calls fail, the exception of the
+    first one is raised.
+    """
+
+    if delay is None:
+        return function(), False, False
+
+    primary = executor.submit(function)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result(), False, False
+
+    hedge = executor.submit(function)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if discard is not None:
+                    for other in {primary, hedge} - {future}:
+                        other.add_done_callback(lambda late: late.exception() is None and discard(late.result()))
+                return future.result(), True, future is hedge
+
+    return primary.result(), True, False
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Logging of the downloader. Article workers must not wait for log output,
+# so the root logger only gets a QueueHandler: a log call puts the record in
+# an unbounded queue and returns, a background thread (QueueListener) writes
+# the log file and the console. Records carry the set and the record ID the
+# logging thread is working on, the JSON lines log file has them as fields.
+# Identical messages repeated in quick succession are rate-limited, the
+# warnings and errors counted for the summary of a run are those that made
+# it into the log.
+
+
+import copy
+import json
+import queue
+import time
+import datetime
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+
+class LogContext(threading.local):
+
+    """Set and record ID the current thread is working on."""
+
+    oai_set = ''
+    record_id = ''
+
+
+log_context = LogContext()
+
+
+def set_log_context(oai_set=None, record_id=None):
+
+    """Sets the set and record ID added to log records of the current thread. None leaves a field as it is."""
+
+    if oai_set is not None:
+        log_context.oai_set = oai_set
+    if record_id is not None:
+        log_context.record_id = record_id
+
+
+class ContextFilter(logging.Filter):
+
+    """Adds the fields of the log context to log records."""
+
+    def filter(self, record):
+        if not hasattr(record, 'oai_set'):
+            record.oai_set = log_context.oai_set
+        if not hasattr(record, 'record_id'):
+            record.record_id = log_context.record_id
+        return True
+
+
+class DuplicateFilter(logging.Filter):
+
+    """
+    Lets at most 'burst' identical messages (same level, text, set and record)
+    through per 'interval' seconds. The first message after a quiet interval
+    tells how many were suppressed.
+    """
+
+    max_keys = 10000        # tracked messages, expired ones are pruned beyond this
+
+    def __init__(self, interval=60, burst=3):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.windows = {}   # {message key: [window start, messages in window]}
+
+    def filter(self, record):
+        key = (record.levelno, record.getMessage(), getattr(record, 'oai_set', ''), getattr(record, 'record_id', ''))
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is not None and now - window[0] <= self.interval:
+                window[1] += 1
+                if window[1] < self.burst:
+                    return True
+                if window[1] == self.burst:
+                    self._amend(record, f'(repeated, identical messages are suppressed for {self.interval} s)')
+                    return True
+                return False
+
+            if len(self.windows) >= self.max_keys:
+                self._prune(now)
+            self.windows[key] = [now, 1]
+            if window is not None and window[1] > self.burst:
+                self._amend(record, f'({window[1] - self.burst} identical messages were suppressed)')
+            return True
+
+    def _amend(self, record, note):
+        record.msg = f'{record.getMessage()} {note}'
+        record.args = None
+
+    def _prune(self, now):
+        self.windows = {key: window for key, window in self.windows.items() if now - window[0] <= self.interval}
+
+
+class FilterOnlyHandler(logging.Handler):
+
+    """Handler that runs its filters and writes nothing."""
+
+    def emit(self, record):
+        pass
+
+
+class LevelCounter(logging.Filter):
+
+    """
+    Counts the log records of a logger and its children ('hinjodl') per
+    level, so a run can tell whether there were warnings or errors. Only
+    records that make it into the log count: attach() puts the counter
+    behind the rate limiting of the log queue (see start_logging()), or on
+    a handler of its own when logging was not started that way.
+    """
+
+    def __init__(self, name='hinjodl'):
+        super().__init__(name)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.handler = None
+
+    def attach(self):
+        queue_handlers = [handler for handler in logging.getLogger().handlers if isinstance(handler, LogQueueHandler)]
+        if queue_handlers:
+            self.handler = queue_handlers[0]
+        else:
+            self.handler = FilterOnlyHandler()
+            logging.getLogger(self.name).addHandler(self.handler)
+        self.handler.addFilter(self)        # after the DuplicateFilter
+
+    def detach(self):
+        if self.handler is not None:
+            self.handler.removeFilter(self)
+            logging.getLogger(self.name).removeHandler(self.handler)    # only the handler of its own
+            self.handler = None
+
+    def filter(self, record):
+        if super().filter(record):
+            with self.lock:
+                self.counts[record.levelno] = self.counts.get(record.levelno, 0) + 1
+        return True
+
+    def count(self, level):
+
+        """Returns the number of records of the given level and above."""
+
+        with self.lock:
+            return sum(number for levelno, number in self.counts.items() if levelno >= level)
+
+
+class LogQueueHandler(QueueHandler):
+
+    """
+    QueueHandler that keeps an exception traceback apart from the message
+    (in exc_text), so the JSON lines log can put it in a field of its own.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+
+    """Formats log records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+                 'level': record.levelname,
+                 'thread': record.threadName,
+                 'logger': record.name,
+                 'set': getattr(record, 'oai_set', ''),
+                 'record': getattr(record, 'record_id', ''),
+                 'message': record.getMessage()}
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def start_logging(timestamp, loglevel, logformat='text'):
+
+    """
+    Routes all logging through a queue to a background writer: a timestamped
+    log file (plain text or JSON lines) and the console (INFO and up).
+    Returns the QueueListener, stop() it to flush the log at the end.
+    """
+
+    if logformat == 'json':
+        file_handler = logging.FileHandler(f'{timestamp}_hindownload.jsonl', encoding='utf-8')
+        file_handler.setFormatter(JsonLinesFormatter())
+    else:
+        file_handler = logging.FileHandler(f'{timestamp}_hindownload.log')
+        file_handler.setFormatter(logging.Formatter('%(asctime)s   %(levelname)-8s   %(threadName)-10s   '
+                                                    '%(message)s   (%(name)s)'))
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('%(levelname)-8s   %(threadName)-10s   %(message)s'))
+    stream_handler.setLevel(logging.INFO)
+
+    log_queue = queue.SimpleQueue()     # unbounded, a log call never blocks
+    queue_handler = LogQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(DuplicateFilter())
+
+    logger = logging.getLogger()    # root logger, to log module messages as well
+    logger.setLevel(getattr(logging, loglevel.upper(), None))
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Mapping of OAI PMH records (plus some data scraped from article pages) to
+# the metadata files of a SIP: dc.xml, harvest.xml and collection.xml.
+#
+# The mapping lives in its own module, so it can be used without network
+# access: with '--rebuild-metadata' the downloader walks existing SIPs and
+# regenerates their XML files from the saved 'oai-record.xml' and the cached
+# article page extracts (see hinjodl.page_extracts). This runs in a process
+# pool, as does the metadata generation of the downloader with
+# '--cpuworkers', hence everything in here takes and returns plain data.
+
+
+import os
+import json
+import datetime
+from copy import copy
+from lxml import etree
+from hinjodl.page_extracts import lookup_page_extracts
+
+
+mandatory_tags = ['dc:title',
+                  'dc:creator',
+                  'dc:publisher',
+                  'dc:date']
+
+xsi_type = etree.QName('http://www.w3.org/2001/XMLSchema-instance', 'type')
+
+
+def make_xml_trees(record_xml, license_string, issn_string, target_name, record_id,
+                   version, seed_url, harvest_date):
+
+    """
+    (Destructively) Translates oai record and other sources to custom xml records.
+
+    Returns a dictionary {filename: ElementTree}, the dc:publisher string and
+    a list of mandatory DC tags missing in the record.
+    """
+
+    # get namespace map from oai record
+    oai_nsmap = record_xml.find('.//{*}dc').nsmap
+    oai_nsmap.pop(None, None)    # removes default ns
+
+    # get elements from oai record
+    dc_elements = record_xml.findall('.//dc:*', namespaces=oai_nsmap)
+    oai_datestamp_element = record_xml.find('.//{*}datestamp')
+
+    # add dcterms namespace for output
+    dc_xml_nsmap = oai_nsmap
+    dc_xml_nsmap['dcterms'] = 'http://purl.org/dc/terms/'
+
+    # root element for dc.xml
+    dc_xml_root = etree.Element('record', nsmap=dc_xml_nsmap)
+
+    # remap dc elements (removing them from their origin at the same time)
+    for element in dc_elements:
+        dc_xml_root.append(element)
+
+    # cut URL part from doi
+    dc_identifier = dc_xml_root.find('.//dc:identifier', namespaces=dc_xml_nsmap)
+    doi_with_url = dc_identifier.text
+    doi_prefix = 'DOI: '
+    doi_without_url = doi_prefix + doi_with_url.partition('doi.org/')[-1]
+    dc_identifier.text = doi_without_url
+
+    # remove dc:rights tag
+    dc_rights = dc_xml_root.find('.//dc:rights', namespaces=dc_xml_nsmap)
+    if dc_rights is not None:
+        dc_rights.getparent().remove(dc_rights)
+
+    # construct additional dcterms elements
+    dc_publisher = dc_xml_root.find('.//dc:publisher', namespaces=dc_xml_nsmap)
+    dc_date = dc_xml_root.find('.//dc:date', namespaces=dc_xml_nsmap)
+
+    dc_xml_ispartof = etree.Element('{http://purl.org/dc/terms/}isPartOf')
+    dc_xml_ispartof.text = f'{dc_publisher.text}/{dc_date.text}'
+    dc_xml_root.append(dc_xml_ispartof)
+    dc_xml_accessrights = etree.SubElement(dc_xml_root, '{http://purl.org/dc/terms/}accessRights')
+    dc_xml_accessrights.text = license_string
+    dc_xml_issued = etree.SubElement(dc_xml_root, '{http://purl.org/dc/terms/}issued')
+    dc_xml_issued.text = oai_datestamp_element.text
+
+    dc_xml_issn = etree.Element('{http://purl.org/dc/elements/1.1/}identifier', {xsi_type: 'dcterms:ISSN'})
+    dc_xml_issn.text = issn_string
+    dc_xml_root.append(dc_xml_issn)
+
+    # dc:publisher is also used in collections.xml
+    publisher_string = dc_publisher.text
+
+    # make elements for collections.xml
+    collection_nsmap = {'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
+                        'dc': 'http://purl.org/dc/elements/1.1/',
+                        'dcterms': 'http://purl.org/dc/terms/'}
+    collection_xml_root = etree.Element('collections', nsmap=collection_nsmap)
+    collection_xml_collection = etree.SubElement(collection_xml_root, 'collection')
+    collection_xml_ispartof = etree.Element('{http://purl.org/dc/terms/}isPartOf')
+    collection_xml_ispartof.text = f'Open Access E-Journals/Hindawi/{publisher_string}'
+    collection_xml_title = etree.Element('{http://purl.org/dc/elements/1.1/}title')
+    collection_xml_title.text = dc_date.text
+    collection_xml_collection.append(collection_xml_ispartof)
+    collection_xml_collection.append(collection_xml_title)
+    collection_xml_collection.append(copy(dc_xml_issn))
+
+    # make elements for harvest.xml
+    harvest_xml_root = etree.Element('harvest')
+    harvest_xml_primaryseedurl = etree.SubElement(harvest_xml_root, 'primarySeedURL')
+    harvest_xml_primaryseedurl.text = seed_url
+    harvest_xml_wctidentifier = etree.SubElement(harvest_xml_root, 'WCTIdentifier')
+    harvest_xml_wctidentifier.text = f'TIB-LZA Journal Downloader Hindawi/ Version: {version}'
+    harvest_xml_targetname = etree.SubElement(harvest_xml_root, 'targetName')
+    harvest_xml_targetname.text = target_name
+    harvest_xml_objectidentifier = etree.SubElement(harvest_xml_root, 'objectIdentifier')
+    harvest_xml_objectidentifier.text = record_id
+    harvest_xml_group = etree.SubElement(harvest_xml_root, 'group')
+    harvest_xml_group.text = 'Hindawi Publishing Corporation'
+    harvest_xml_harvestdate = etree.SubElement(harvest_xml_root, 'harvestDate')
+    harvest_xml_harvestdate.text = harvest_date
+
+    # any mandatory tags missing?
+    missing_tags = []
+    for tag in mandatory_tags:
+        element = dc_xml_root.find(f'.//{tag}', namespaces=dc_xml_nsmap)
+        if element is None:
+            missing_tags.append(tag)
+
+    trees = {'dc.xml': etree.ElementTree(dc_xml_root),
+             'harvest.xml': etree.ElementTree(harvest_xml_root),
+             'collection.xml': etree.ElementTree(collection_xml_root)}
+
+    return trees, publisher_string, missing_tags
+
+
+def serialize_xml_trees(trees):
+
+    """Returns the serialized XML files as a dictionary {filename: bytes}."""
+
+    documents = {}
+    for filename, tree in trees.items():
+        if filename == 'dc.xml':
+            documents[filename] = etree.tostring(tree,
+                                                 xml_declaration=True,
+                                                 encoding='utf-8',
+                                                 pretty_print=True)
+        else:
+            documents[filename] = etree.tostring(tree,
+                                                 xml_declaration=True,
+                                                 standalone=False,
+                                                 encoding='utf-8',
+                                                 pretty_print=True)
+    return documents
+
+
+def make_xml_documents(record_raw, license_string, issn_string, target_name, record_id,
+                       version, seed_url, harvest_date):
+
+    """
+    Like make_xml_trees(), but from the serialized OAI record and with the
+    serialized XML files {filename: bytes} as result, so it can run in a
+    worker process of the downloader (see '--cpuworkers').
+    """
+
+    record_xml = etree.fromstring(record_raw.encode('utf-8'))
+    trees, publisher_string, missing_tags = make_xml_trees(record_xml, license_string, issn_string, target_name,
+                                                           record_id, version, seed_url, harvest_date)
+    return serialize_xml_trees(trees), publisher_string, missing_tags
+
+
+def write_documents(folder, documents, atomic=False):
+
+    """Writes files from a dictionary {filename: bytes}, optionally replacing existing ones atomically."""
+
+    for filename, content in documents.items():
+        path = os.path.join(folder, filename)
+        if atomic:
+            with open(path + '.tmp', 'wb') as file:
+                file.write(content)
+            os.replace(path + '.tmp', path)
+        else:
+            with open(path, 'wb') as file:
+                file.write(content)
+
+
+def page_extracts_file(folder, record_id):
+
+    """Returns the path of the page extracts of a record cached as JSON file by older versions."""
+
+    filename = record_id.split(':')[2].replace('/', '_').replace('.', '_') + '.json'
+    return os.path.join(folder, filename)
+
+
+def load_page_extracts(cache_file, legacy_folder, record_id):
+
+    """Returns cached article page extracts of a record, None if there are none."""
+
+    extracts = lookup_page_extracts(cache_file, record_id)
+    if extracts is not None:
+        return extracts
+    path = page_extracts_file(legacy_folder, record_id)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def extracts_from_dc_xml(sip_folder):
+
+    """Recovers license and ISSN from an existing dc.xml (SIPs harvested before extracts were cached)."""
+
+    dc_xml = etree.parse(os.path.join(sip_folder, 'dc.xml')).getroot()
+    license_element = dc_xml.find('{http://purl.org/dc/terms/}accessRights')
+    issn_element = dc_xml.find(f'{{http://purl.org/dc/elements/1.1/}}identifier[@{{{xsi_type.namespace}}}type="dcterms:ISSN"]')
+
+    return {'license': license_element.text if license_element is not None else None,
+            'issn': issn_element.text if issn_element is not None else None}
+
+
+def rebuild_sip_metadata(sip_folder, extracts_cache, extracts_folder, version, seed_url):
+
+    """
+    Regenerates dc.xml, harvest.xml and collection.xml of a SIP without network access.
+
+    Sources are the saved oai-record.xml, cached article page extracts (or
+    the existing dc.xml) and the provenance information of the existing
+    harvest.xml. Returns (sip_folder, missing mandatory tags, error message).
+    """
+
+    try:
+        record_xml = etree.parse(os.path.join(sip_folder, 'oai-record.xml')).getroot()
+        record_id = record_xml.find('.//{*}header/{*}identifier').text
+
+        extracts = load_page_extracts(extracts_cache, extracts_folder, record_id)
+        if extracts is None:
+            extracts = extracts_from_dc_xml(sip_folder)
+
+        # keep provenance of the original harvest
+        harvest_xml = etree.parse(os.path.join(sip_folder, 'harvest.xml')).getroot()
+        target_name = harvest_xml.findtext('targetName')
+        harvest_date = harvest_xml.findtext('harvestDate')
+        if not harvest_date:
+            mtime = os.path.getmtime(os.path.join(sip_folder, 'oai-record.xml'))
+            harvest_date = datetime.datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
+
+        trees, publisher_string, missing_tags = make_xml_trees(record_xml,
+                                                               extracts['license'],
+                                                               extracts['issn'],
+                                                               target_name,
+                                                               record_id,
+                                                               version,
+                                                               seed_url,
+                                                               harvest_date)
+        write_documents(sip_folder, serialize_xml_trees(trees), atomic=True)
+    except Exception as exception:
+        return sip_folder, [], f'{exception.__class__.__name__}: {exception}'
+
+    return sip_folder, missing_tags, None
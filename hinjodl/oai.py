@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# OAI-PMH access of the downloader. This is the only module that needs
+# Sickle (and with it lxml). The harvester imports it on first use, so
+# commands that never talk to the OAI-PMH interface start without them.
+
+
+from sickle import Sickle, oaiexceptions
+from sickle.models import Header
+from sickle.oaiexceptions import NoRecordsMatch, BadResumptionToken
+
+
+__all__ = ['PacedSickle', 'get_identifier_page', 'get_granularity', 'NoRecordsMatch', 'BadResumptionToken']
+
+
+class PacedSickle(Sickle):
+
+    """
+    OAI-PMH harvester that takes a token from the request limiter before each
+    request. Given a requests session, it keeps its connections open.
+    """
+
+    def __init__(self, endpoint, request_limiter, session=None, **kwargs):
+        super().__init__(endpoint, **kwargs)
+        self.request_limiter = request_limiter
+        self.session = session
+
+    def _request(self, kwargs):
+        if self.session is None:
+            return super()._request(kwargs)
+        if self.http_method == 'GET':
+            return self.session.get(self.endpoint, params=kwargs, **self.request_args)
+        return self.session.post(self.endpoint, data=kwargs, **self.request_args)
+
+    def harvest(self, **kwargs):
+        self.request_limiter.acquire()
+        return super().harvest(**kwargs)
+
+
+def get_identifier_page(sickle, params):
+
+    """
+    Requests a single ListIdentifiers page, returns its records as
+    [(identifier, datestamp)] and the next resumption token. Deleted records
+    are left out, there is nothing to download for them.
+    """
+
+    response = sickle.harvest(**params)
+
+    error = response.xml.find('.//' + sickle.oai_namespace + 'error')
+    if error is not None:
+        code = error.attrib.get('code', 'UNKNOWN')
+        if code == 'noRecordsMatch':
+            return [], None
+        oai_exception = getattr(oaiexceptions, code[0].upper() + code[1:], oaiexceptions.OAIError)
+        raise oai_exception(error.text or '')
+
+    headers = response.xml.iterfind('.//' + sickle.oai_namespace + 'header')
+    identifiers = [(header.identifier, header.datestamp) for header in map(Header, headers) if not header.deleted]
+
+    token_element = response.xml.find('.//' + sickle.oai_namespace + 'resumptionToken')
+    token = token_element.text if token_element is not None else None
+
+    return identifiers, token
+
+
+def get_granularity(sickle):
+
+    """Returns the datestamp granularity of the repository: 'YYYY-MM-DD' or 'YYYY-MM-DDThh:mm:ssZ'."""
+
+    granularity = getattr(sickle.Identify(), 'granularity', 'YYYY-MM-DD')
+    return 'YYYY-MM-DDThh:mm:ssZ' if granularity == 'YYYY-MM-DDThh:mm:ssZ' else 'YYYY-MM-DD'
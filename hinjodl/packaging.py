@@ -0,0 +1,540 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Output layouts of a SIP. The classic layout is a folder per SIP with about
+# eight small files, written in the staging area and moved into the set
+# folder when complete. Across the archive those are hundreds of thousands
+# of inodes. The small files are kept in memory until the SIP is complete
+# and written in one go, right before the SIP is synced to disk and moved.
+# With '--package' a SIP (or a whole set) becomes a single tar file instead,
+# optionally structured as a BagIt bag (RFC 8493).
+#
+# Packaged files are kept in spooled temporary files while the SIP is being
+# built: small files stay in memory, large ones go to the staging area. On
+# commit they are appended to the package in one go, together with their
+# manifest entries (digests are computed while the data streams in, see
+# hinjodl.checksums). Bags get a manifest per configured digest algorithm.
+# Failed SIPs never touch the package. Packages are written to a target of
+# the storage backend (see hinjodl.storage): a file in the staging area that
+# is moved into place when complete, or an upload to an object store.
+#
+# The reader lists and verifies packages without unpacking them:
+#
+#   python3 -m hinjodl.packaging list HINDAWI_JPOL_2016_2021-10-05_12-00-00.tar
+#   python3 -m hinjodl.packaging verify dl/HINDAWI_JPOL_2016_2021-10-05_12-00-00/*.tar
+
+
+import os
+import sys
+import time
+import argparse
+import datetime
+import tarfile
+import tempfile
+import threading
+from shutil import rmtree
+from hinjodl.checksums import MultiDigest, HashingFile, default_algorithms
+
+
+spool_size = 8 * 1024**2        # files larger than this are spooled to the staging area instead of memory
+read_chunk_size = 1024**2
+
+
+def sync_file(path):
+
+    """Flushes a file or folder to disk."""
+
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class FolderSip:
+
+    """
+    SIP as a folder in the staging area, moved into the set folder on commit.
+    Small files given to write() (metadata, manifest, sidecars) are kept in
+    memory and written together on commit, when the SIP is synced to disk.
+    """
+
+    can_link = True     # duplicates can be symlinked to it
+
+    def __init__(self, staging_path, path, algorithms=default_algorithms):
+        self.staging_path = staging_path
+        self.path = path    # final location
+        self.algorithms = algorithms
+        self.lock = threading.Lock()
+        self.pending = {}       # {name: content} of small files, written on commit
+        self.streamed = set()   # names of the files written with open()
+
+    def create(self):
+        os.makedirs(os.path.join(self.staging_path, 'MASTER'))
+
+    def open(self, name):
+
+        """
+        Returns a binary file object for a file of the SIP, e.g.
+        'MASTER/123.pdf'. Its 'digest' holds the checksums of what was written.
+        """
+
+        path = os.path.join(self.staging_path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)     # large files are downloaded concurrently
+        with self.lock:
+            self.pending.pop(name, None)
+            self.streamed.add(name)
+        return HashingFile(open(path, 'wb'), self.algorithms)
+
+    def write(self, name, content):
+        with self.lock:
+            self.pending[name] = bytes(content)
+
+    def remove(self, name):
+        with self.lock:
+            if self.pending.pop(name, None) is not None:
+                return
+            self.streamed.discard(name)
+        os.remove(os.path.join(self.staging_path, name))
+
+    def exists(self):
+        return os.path.isdir(self.path)
+
+    def commit(self):
+
+        """Writes the small files, syncs the SIP and moves it into the set folder in one rename."""
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            streamed, self.streamed = self.streamed, set()
+        for name, content in pending.items():
+            path = os.path.join(self.staging_path, name)
+            if '/' in name:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(content)
+                file.flush()
+                os.fsync(file.fileno())
+        # streamed files are synced only now, most of their data reached the disk by then
+        for name in streamed:
+            sync_file(os.path.join(self.staging_path, name))
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)     # shard folder, see hinjodl.sip_layout
+        os.rename(self.staging_path, self.path)
+        sync_file(os.path.dirname(self.path))     # makes the rename durable
+
+    def discard(self, onerror=None):
+
+        """Removes the staging folder. It is moved out of the way first, a stalled thread may still write to it."""
+
+        with self.lock:
+            self.pending = {}
+            self.streamed = set()
+        if not os.path.isdir(self.staging_path):
+            return
+        discarded_path = f'{self.staging_path}.discarded-{id(self)}'
+        os.rename(self.staging_path, discarded_path)
+        rmtree(discarded_path, onerror=onerror)
+
+
+class StagedFile:
+
+    """Binary file written in the staging area and moved to its final path on commit()."""
+
+    def __init__(self, staging_path, path):
+        self.staging_path = staging_path
+        self.path = path
+        self.file = open(staging_path, 'wb')
+
+    def write(self, data):
+        return self.file.write(data)
+
+    def tell(self):
+        return self.file.tell()
+
+    def commit(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())    # the one sync of a packaged SIP
+        self.file.close()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        os.replace(self.staging_path, self.path)
+
+    def discard(self):
+        self.file.close()
+        os.remove(self.staging_path)
+
+
+class SpooledMember:
+
+    """Writable file of a packaged SIP. It joins the SIP when closed."""
+
+    def __init__(self, sip, name):
+        self.sip = sip
+        self.name = name
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_size, dir=sip.spool_folder)
+        self.digest = MultiDigest(sip.algorithms)
+        self.closed = False
+
+    def write(self, data):
+        self.file.write(data)
+        self.digest.update(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.sip.add_member(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PackagedSip:
+
+    """
+    SIP written into a tar package: its own (package=None) or the package of
+    the set. The files are spooled until commit. Its own package goes to the
+    storage backend (see hinjodl.storage), by default to the local path.
+    """
+
+    def __init__(self, folder_name, spool_folder, path, package=None, bagit=False, algorithms=default_algorithms,
+                 storage=None):
+        self.folder_name = folder_name
+        self.spool_folder = spool_folder
+        self.package = package
+        self.storage = storage
+        self.bagit = package.bagit if package is not None else bagit
+        self.algorithms = package.algorithms if package is not None else algorithms
+        self.path = package.path if package is not None else path
+        self.can_link = package is None and (storage is None or storage.can_link)
+        self.lock = threading.Lock()
+        self.members = {}   # {name: SpooledMember}
+
+    def create(self):
+        os.makedirs(self.spool_folder, exist_ok=True)
+
+    def open(self, name):
+        return SpooledMember(self, name)
+
+    def write(self, name, content):
+        with self.open(name) as file:
+            file.write(content)
+
+    def add_member(self, member):
+        with self.lock:
+            replaced = self.members.pop(member.name, None)
+            self.members[member.name] = member
+        if replaced is not None:
+            replaced.file.close()
+
+    def remove(self, name):
+        with self.lock:
+            member = self.members.pop(name, None)
+        if member is not None:
+            member.file.close()
+
+    def exists(self):
+        if self.package is not None:
+            return self.folder_name in self.package
+        if self.storage is not None:
+            return self.storage.exists(self.path)
+        return os.path.lexists(self.path)
+
+    def commit(self):
+        with self.lock:
+            members = sorted(self.members.values(), key=lambda member: member.name)
+            self.members = {}
+        try:
+            if self.package is not None:
+                self.package.add_sip(self.folder_name, members)
+            else:
+                staging_path = os.path.join(self.spool_folder, self.folder_name + '.tar')
+                if self.storage is not None:
+                    target = self.storage.create_file(self.path, staging_path)
+                else:
+                    target = StagedFile(staging_path, self.path)
+                package = TarPackage(target,
+                                     self.folder_name,
+                                     self.bagit,
+                                     self.algorithms,
+                                     self.spool_folder)
+                try:
+                    package.add_sip('', members)
+                except BaseException:
+                    package.discard()
+                    raise
+                package.close()
+        finally:
+            for member in members:
+                member.file.close()
+
+    def discard(self, onerror=None):
+        with self.lock:
+            members = list(self.members.values())
+            self.members = {}
+        for member in members:
+            member.file.close()
+
+
+class TarPackage:
+
+    """
+    Tar file of one SIP or of a whole set, optionally as BagIt bag. It is
+    written to a target (StagedFile, or see hinjodl.storage) that is committed
+    on close(). Safe to share between threads.
+    """
+
+    def __init__(self, target, root, bagit=False, algorithms=default_algorithms, spool_folder=None):
+        self.target = target
+        self.path = target.path
+        self.root = root        # top folder in the package
+        self.bagit = bagit
+        self.algorithms = algorithms
+        self.lock = threading.Lock()
+        self.tar = tarfile.open(fileobj=target, mode='w', format=tarfile.PAX_FORMAT)
+        self.folders = set()    # SIPs in the package
+        self.payload_bytes = 0
+        self.payload_files = 0
+        self.tag_files = {}     # {name: MultiDigest} of tag files added with add_tag_file()
+        # bag manifest lines can add up for large sets, they wait on disk
+        self.manifests = {}
+        if bagit:
+            self.manifests = {algorithm: tempfile.TemporaryFile(dir=spool_folder)
+                              for algorithm in algorithms}
+
+    def __contains__(self, folder_name):
+        with self.lock:
+            return folder_name in self.folders
+
+    def __len__(self):
+        with self.lock:
+            return len(self.folders)
+
+    def add_sip(self, folder_name, members):
+
+        """Appends the files of a SIP. folder_name is empty if the package only holds this SIP."""
+
+        with self.lock:
+            for member in members:
+                relative_name = f'{folder_name}/{member.name}' if folder_name else member.name
+                if self.bagit:
+                    relative_name = f'data/{relative_name}'
+                size = member.file.tell()
+                member.file.seek(0)
+                self._add_file(relative_name, member.file, size)
+                self.payload_bytes += size
+                self.payload_files += 1
+                hexdigests = member.digest.hexdigests()
+                for algorithm, manifest in self.manifests.items():
+                    manifest.write(f'{hexdigests[algorithm]}  {relative_name}\n'.encode('utf-8'))
+            self.folders.add(folder_name)
+
+    def add_tag_file(self, name, path):
+
+        """Adds a file outside the payload, e.g. the manifest of a set. It is listed in the tag manifests of a bag."""
+
+        digest = MultiDigest(self.algorithms)
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(read_chunk_size), b''):
+                digest.update(chunk)
+            file.seek(0)
+            with self.lock:
+                self._add_file(name, file, digest.size)
+                self.tag_files[name] = digest
+
+    def _add_file(self, relative_name, file, size):
+        info = tarfile.TarInfo(f'{self.root}/{relative_name}')
+        info.size = size
+        info.mtime = time.time()
+        info.mode = 0o644
+        self.tar.addfile(info, file)
+
+    def _add_bytes(self, relative_name, content):
+        file = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        file.write(content)
+        file.seek(0)
+        self._add_file(relative_name, file, len(content))
+        file.close()
+
+    def _write_bag_tags(self):
+        tag_files = dict(self.tag_files)
+        for algorithm, manifest in self.manifests.items():
+            manifest_size = manifest.tell()
+            manifest.seek(0)
+            digest = MultiDigest(self.algorithms)
+            for chunk in iter(lambda: manifest.read(read_chunk_size), b''):
+                digest.update(chunk)
+            manifest.seek(0)
+            self._add_file(f'manifest-{algorithm}.txt', manifest, manifest_size)
+            tag_files[f'manifest-{algorithm}.txt'] = digest
+
+        for name, content in (('bagit.txt', b'BagIt-Version: 1.0\nTag-File-Character-Encoding: UTF-8\n'),
+                              ('bag-info.txt', (f'Bagging-Date: {datetime.date.today().isoformat()}\n'
+                                                f'External-Identifier: {self.root}\n'
+                                                f'Payload-Oxum: {self.payload_bytes}.{self.payload_files}\n').encode('utf-8'))):
+            self._add_bytes(name, content)
+            digest = MultiDigest(self.algorithms)
+            digest.update(content)
+            tag_files[name] = digest
+
+        for algorithm in self.algorithms:
+            tag_manifest = [f'{digest.hexdigests()[algorithm]}  {name}\n' for name, digest in sorted(tag_files.items())]
+            self._add_bytes(f'tagmanifest-{algorithm}.txt', ''.join(tag_manifest).encode('utf-8'))
+
+    def close(self):
+
+        """Completes the package and commits it to its final path."""
+
+        with self.lock:
+            if self.bagit:
+                self._write_bag_tags()
+            for manifest in self.manifests.values():
+                manifest.close()
+            self.tar.close()
+            self.target.commit()
+
+    def discard(self):
+        with self.lock:
+            for manifest in self.manifests.values():
+                manifest.close()
+            self.tar.close()
+            self.target.discard()
+
+
+class PackageReader:
+
+    """Reads a SIP package (tar, optionally BagIt) without unpacking it."""
+
+    def __init__(self, path):
+        self.path = path
+        self.tar = tarfile.open(path, 'r:')
+        self.members = [member for member in self.tar.getmembers() if member.isfile()]
+        names = {member.name for member in self.members}
+        roots = {member.name.split('/', 1)[0] for member in self.members}
+        self.bagit = any(f'{root}/bagit.txt' in names for root in roots)
+
+    def sips(self):
+
+        """Returns {SIP folder in the package: [files]}. A SIP is a folder holding an oai-record.xml."""
+
+        sip_roots = sorted(member.name[:-len('/oai-record.xml')] for member in self.members
+                           if member.name.endswith('/oai-record.xml'))
+        sips = {root: [] for root in sip_roots}
+        for member in self.members:
+            folder = member.name
+            while '/' in folder:
+                folder = folder.rsplit('/', 1)[0]
+                if folder in sips:
+                    sips[folder].append(member)
+                    break
+        return sips
+
+    def open(self, name):
+
+        """Returns a file object for a file in the package."""
+
+        return self.tar.extractfile(name)
+
+    def object_identifier(self, sip_root):
+
+        """Returns the OAI identifier from the harvest.xml of a SIP, None if there is none."""
+
+        from lxml import etree
+
+        try:
+            return etree.parse(self.open(f'{sip_root}/harvest.xml')).getroot().findtext('objectIdentifier')
+        except (KeyError, etree.XMLSyntaxError):
+            return None
+
+    def verify(self):
+
+        """
+        Checks the payload of a bag against its manifests (all algorithms, in
+        one pass over each file). Returns a list of problems.
+        """
+
+        if not self.bagit:
+            return ['Not a BagIt package, nothing to verify.']
+
+        problems = []
+        names = {member.name for member in self.members}
+        roots = {member.name.split('/', 1)[0] for member in self.members}
+        for root in sorted(roots):
+            manifest_names = sorted(name for name in names
+                                    if name.startswith(f'{root}/manifest-') and name.endswith('.txt'))
+            if not manifest_names:
+                problems.append(f'{root} has no manifest.')
+                continue
+            expected = {}   # {file: {algorithm: digest}}
+            for manifest_name in manifest_names:
+                algorithm = manifest_name[len(f'{root}/manifest-'):-len('.txt')]
+                for line in self.open(manifest_name).read().decode('utf-8').splitlines():
+                    digest, name = line.split(maxsplit=1)
+                    expected.setdefault(f'{root}/{name}', {})[algorithm] = digest
+            payload = {member.name: member for member in self.members if member.name.startswith(f'{root}/data/')}
+            for name in sorted(payload.keys() - expected.keys()):
+                problems.append(f'{name} is not in the manifest.')
+            for name in sorted(expected.keys() - payload.keys()):
+                problems.append(f'{name} is in the manifest, but missing.')
+            for name in sorted(expected.keys() & payload.keys()):
+                digest = MultiDigest(expected[name])
+                with self.open(payload[name]) as file:
+                    for chunk in iter(lambda: file.read(read_chunk_size), b''):
+                        digest.update(chunk)
+                for algorithm, hexdigest in digest.hexdigests().items():
+                    if hexdigest != expected[name][algorithm]:
+                        problems.append(f'{name} does not match its {algorithm} checksum.')
+        return problems
+
+    def close(self):
+        self.tar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='List or verify SIP packages written with --package.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = subparsers.add_parser('list', help='List the SIPs in packages.')
+    list_parser.add_argument('packages', nargs='+', metavar='PACKAGE')
+
+    verify_parser = subparsers.add_parser('verify', help='Check the files of BagIt packages against their manifests.')
+    verify_parser.add_argument('packages', nargs='+', metavar='PACKAGE')
+
+    cl_args = parser.parse_args()
+
+    failed = False
+    for path in cl_args.packages:
+        with PackageReader(path) as package:
+            if cl_args.command == 'list':
+                layout = 'BagIt' if package.bagit else 'tar'
+                sips = package.sips()
+                print(f'{path} ({layout}, {len(sips)} SIPs)')
+                for sip_root, files in sips.items():
+                    size = sum(member.size for member in files)
+                    print(f'  {sip_root}  {package.object_identifier(sip_root) or "?"}  '
+                          f'{len(files)} files  {size} bytes')
+            else:
+                problems = package.verify()
+                for problem in problems:
+                    print(f'{path}: {problem}')
+                if problems:
+                    failed = True
+                else:
+                    print(f'{path}: OK')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Cache of the data scraped from article pages (URLs, license, ISSN, Dublin
+# Core meta tags), so '--rebuild-metadata' can regenerate the metadata of
+# SIPs without network access.
+#
+# The extracts are downloader-internal and stay out of the SIPs, which go to
+# the archive as they are. They are kept in an SQLite file next to the
+# checkpoints, one row per record, and saved when the SIP of the record is
+# committed: discarded SIPs leave nothing behind. Nothing depends on the
+# cache being complete, an entry lost in a crash only means that rebuilding
+# falls back to the dc.xml of the SIP. So SQLite does not sync it to disk.
+#
+# Older versions wrote one JSON file per record into a 'page_extracts'
+# folder. Rebuilding still reads those (see hinjodl.metadata_mapping).
+
+
+import os
+import json
+import sqlite3
+import threading
+from contextlib import closing
+
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS extracts (
+        record_id TEXT PRIMARY KEY,
+        extracts TEXT NOT NULL
+    ) WITHOUT ROWID;
+'''
+
+
+class PageExtractCache:
+
+    """Record ID to the page extracts of its latest SIP. Safe to share between threads."""
+
+    def __init__(self, filename):
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.executescript(SCHEMA)
+
+    def save(self, record_id, extracts):
+
+        """Remembers the page extracts of a record, replacing older ones."""
+
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO extracts (record_id, extracts) VALUES (?, ?)',
+                                    (record_id, json.dumps(extracts)))
+
+    def close(self):
+        self.connection.close()
+
+
+def lookup_page_extracts(filename, record_id):
+
+    """Returns the cached page extracts of a record, None if there are none. Opens the cache read-only."""
+
+    if not os.path.isfile(filename):
+        return None
+    with closing(sqlite3.connect(f'file:{filename}?mode=ro', uri=True)) as connection:
+        entry = connection.execute('SELECT extracts FROM extracts WHERE record_id = ?', (record_id,)).fetchone()
+    return json.loads(entry[0]) if entry is not None else None
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Scraping of article pages: Dublin Core metadata, license, ISSN and the
+# links of the article files.
+#
+# Parsing a page with Beautiful Soup takes far longer than downloading it and
+# holds the GIL all the time, so with many article workers it becomes the
+# bottleneck. With '--cpuworkers' the harvester hands the raw page to a
+# process pool (like the XML generation, see make_xml_documents() in
+# hinjodl.metadata_mapping). Hence everything in here takes bytes and
+# returns plain data, and leaves the logging to the caller.
+
+
+import re
+from bs4 import BeautifulSoup
+
+
+license_pattern = re.compile(r'.*Creative\sCommons\sAttribution\sLicense.*')
+download_link_pattern = re.compile(r'.*downloads\.hindawi\.com.*')
+dc_meta_pattern = re.compile(r'dc\..*')
+
+
+def scrape_dc_metadata(page_content):
+
+    """Returns the Dublin Core metadata of the page as {'dc.title': [...], ...}."""
+
+    page_dc = {}
+
+    # mapping to subdictionary and list since DC elements are repeatable
+    for element in page_content.find_all('meta', {'name': dc_meta_pattern}):
+        page_dc.setdefault(element.get('name'), []).append(element.get('content'))
+    return page_dc
+
+
+def get_license_information(page_content):
+
+    """Returns the link to the CC License, None if there is none. False if the license is mentioned without link."""
+
+    license_element = page_content.find(['a', 'ext-link'], string=license_pattern)
+    if license_element is None:
+        return None
+
+    license = license_element.get('href')
+    if license is None:
+        license = license_element.get('xlink:href')
+    return license or False
+
+
+def get_issn(page_content):
+
+    """Returns the ISSN of the journal, None if there is none."""
+
+    issn_element = page_content.find('meta', {'name': 'citation_issn'})  # name is a reserved kw in bs
+    if issn_element is None:
+        return None
+    return issn_element.get('content') or None
+
+
+def get_download_links(page_content):
+
+    """Returns a list of article file URLs."""
+
+    # this returns some identical links, some only differ in their prefix.
+    # we are stripping the "http(s)" prefix before removing the duplicates.
+    # later we pragmatically assume "https" will work in all cases.
+    # in case it does not, the download function will report an error.
+
+    links = [element.get('href').split('//')[1]
+             for element in page_content.find_all('a', href=download_link_pattern)]
+    links = dict.fromkeys(links)        # kills duplicates, keeps the order of the page
+
+    return [f'https://{link}' for link in links]
+
+
+def extract_page_data(page_bytes, encoding=None):
+
+    """
+    Parses an article page (the raw bytes of the response) and returns what
+    the downloader needs from it:
+    {'dc': {...}, 'license': ..., 'issn': ..., 'links': [...]}.
+    """
+
+    page_content = BeautifulSoup(page_bytes, 'lxml', from_encoding=encoding)
+    return {'dc': scrape_dc_metadata(page_content),
+            'license': get_license_information(page_content),
+            'issn': get_issn(page_content),
+            'links': get_download_links(page_content)}
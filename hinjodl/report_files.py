@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Run-wide report files that get a line per record, like the tracking of
+# journal title strings. Opening the file for every line adds up over
+# hundreds of thousands of records and many article workers, so the lines
+# are collected in memory and appended in batches: when enough lines came
+# together, when the last batch is some seconds old, and on flush().
+
+
+import time
+import threading
+
+
+class BatchedAppendFile:
+
+    """Text file that lines are appended to in batches. Safe to share between threads."""
+
+    def __init__(self, path, max_lines=1000, max_delay=30):
+        self.path = path
+        self.max_lines = max_lines
+        self.max_delay = max_delay      # seconds
+        self.lock = threading.Lock()
+        self.lines = []
+        self.last_flush = time.monotonic()
+
+    def write(self, line):
+        with self.lock:
+            self.lines.append(line)
+            if len(self.lines) >= self.max_lines or time.monotonic() - self.last_flush >= self.max_delay:
+                self._flush()
+
+    def _flush(self):
+        if self.lines:
+            with open(self.path, 'a') as file:
+                file.writelines(self.lines)
+            self.lines = []
+        self.last_flush = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Index of the records the downloader has already turned into SIPs.
+#
+# A setfile may list a journal together with its own subsets, and the same
+# OAI identifier can show up under more than one setSpec. Without an index
+# every occurrence is downloaded again into a different set folder. The
+# index maps each record ID to the first SIP made from it, so later
+# occurrences can be linked to (or skipped) instead.
+#
+# By default the index only lives for one run, in a temporary SQLite file so
+# it does not take up memory however many records a run covers. With a
+# filename it is kept and applies to later runs, as long as the SIPs it
+# points to still exist. SIPs in an object store (s3:// URLs, see
+# hinjodl.storage) are not checked for that.
+
+
+import os
+import sqlite3
+import threading
+
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS seen (
+        record_id TEXT PRIMARY KEY,
+        sip_path TEXT NOT NULL,
+        set_spec TEXT NOT NULL
+    ) WITHOUT ROWID;
+'''
+
+
+class SeenRecords:
+
+    """Record ID to (SIP path, setSpec) of the first SIP (folder or package) made from it. Safe to share between threads."""
+
+    def __init__(self, filename=None):
+
+        self.lock = threading.Lock()
+        # an empty filename makes SQLite create a temporary database, deleted when closed
+        self.connection = sqlite3.connect(filename or '', check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def get(self, record_id):
+
+        """Returns (SIP path, setSpec) for a record ID, None if there is no existing SIP for it."""
+
+        with self.lock:
+            entry = self.connection.execute('SELECT sip_path, set_spec FROM seen WHERE record_id = ?',
+                                            (record_id,)).fetchone()
+        if entry is None or ('://' not in entry[0] and not os.path.exists(entry[0])):
+            return None
+        return tuple(entry)
+
+    def add(self, record_id, sip_path, set_spec):
+
+        """Remembers the SIP made from a record."""
+
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO seen (record_id, sip_path, set_spec) '
+                                    'VALUES (?, ?, ?)',
+                                    (record_id, sip_path, set_spec))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Where a SIP goes inside its set folder. In the default 'flat' layout every
+# SIP (folder or package) is a direct child of the set folder. Journal level
+# sets with tens of thousands of articles turn into huge directories that
+# are slow to list and to look up in. '--layout' spreads them over subfolders
+# ("shards"):
+#
+#   flat        <set folder>/10_1155_2017_200001
+#   hash        <set folder>/3f/10_1155_2017_200001
+#   doiprefix   <set folder>/10_1155_2017/10_1155_2017_200001
+#
+# 'hash' uses the first two hex digits of the MD5 of the SIP folder name, that
+# is up to 256 evenly filled shards. 'doiprefix' uses the DOI without its last
+# part, for Hindawi the publication year of the article, which keeps the
+# shards readable but only helps with sets spanning several years.
+#
+# The path of a SIP follows from the record ID alone (sip_path()), without
+# listing anything. Readers that do not know the layout use list_sips(): a
+# folder in a set folder that holds no 'oai-record.xml' is a shard.
+
+
+import os
+import hashlib
+
+
+layouts = ('flat', 'hash', 'doiprefix')
+record_file_name = 'oai-record.xml'     # every SIP folder has one
+
+
+def sip_folder_name(record_id):
+
+    """Returns the name of the SIP folder of a record, e.g. '10_1155_2017_200001' for 'oai:hindawi.com:10.1155/2017/200001'."""
+
+    return record_id.split(':')[2].replace('/', '_').replace('.', '_')
+
+
+def shard_name(record_id, layout='flat'):
+
+    """Returns the shard folder of a record in the set folder, None in the flat layout."""
+
+    if layout == 'flat':
+        return None
+    if layout == 'hash':
+        return hashlib.md5(sip_folder_name(record_id).encode('utf-8')).hexdigest()[:2]
+    if layout == 'doiprefix':
+        doi = record_id.split(':')[2]
+        return doi.rsplit('/', 1)[0].replace('/', '_').replace('.', '_')
+    raise ValueError(f'Unknown layout {layout}.')
+
+
+def sip_location(record_id, layout='flat'):
+
+    """Returns the path of the SIP of a record relative to its set folder, as tuple of folder names."""
+
+    shard = shard_name(record_id, layout)
+    folder_name = sip_folder_name(record_id)
+    return (shard, folder_name) if shard else (folder_name,)
+
+
+def sip_path(set_path, record_id, layout='flat', suffix=''):
+
+    """Returns the path of the SIP of a record, suffix is '.tar' for packaged SIPs."""
+
+    return os.path.join(set_path, *sip_location(record_id, layout)) + suffix
+
+
+def list_sips(set_path):
+
+    """
+    Returns the SIPs of a set folder in any layout, as os.DirEntry of SIP
+    folders and packages (links to duplicates are left out), and the paths
+    of its shard folders.
+    """
+
+    sips = []
+    shards = []
+    with os.scandir(set_path) as entries:
+        for entry in entries:
+            if entry.name.endswith('.tar') and entry.is_file(follow_symlinks=False):
+                sips.append(entry)
+            elif entry.is_dir(follow_symlinks=False):
+                if os.path.isfile(os.path.join(entry.path, record_file_name)):
+                    sips.append(entry)
+                else:
+                    shards.append(entry.path)
+    for shard in shards:
+        with os.scandir(shard) as entries:
+            sips.extend(entry for entry in entries
+                        if entry.is_dir(follow_symlinks=False)
+                        or (entry.name.endswith('.tar') and entry.is_file(follow_symlinks=False)))
+    return sips, shards
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Statistical check of the file sizes in the archive. Fixed limits ("smaller
+# than 1 KiB", "larger than 1 GiB") flag long lists of files that are fine:
+# a short erratum PDF is small, a video supplement is large. Instead, the
+# sizes are compared with those of similar files, i.e. the same journal (or
+# set), the same role (article file or supplement) and the same extension.
+# A file is an outlier if its size is far off the median of its group on a
+# logarithmic scale, measured in robust z-scores based on the median absolute
+# deviation (MAD):
+#
+#   z = 0.6745 * (log10(size) - median) / MAD
+#
+# Groups with too few files for that are compared with all files of the same
+# role and extension instead. Empty files are always reported. The statistics
+# are computed with NumPy over all files at once, which takes seconds even for
+# millions of files; the time goes into reading the sizes. Those are taken
+# from the manifests written by the downloader (see hinjodl.checksums) where
+# there are any, otherwise from a scan of the MASTER folders. Packaged SIPs
+# (see hinjodl.packaging) are read from the tar headers.
+#
+#   python3 -m hinjodl.size_anomalies /download/folder /ingested/folder
+#   python3 -m hinjodl.size_anomalies --groupby set --threshold 5 --report report.csv /download/folder
+#
+# The result is a CSV report of the outliers, ranked by their score. NumPy is
+# needed for this tool only, not for the downloader ('pip3 install .[analysis]').
+
+
+import os
+import re
+import sys
+import csv
+import time
+import hashlib
+import tarfile
+import argparse
+from array import array
+import numpy as np
+from hinjodl.checksums import manifest_name, read_manifest
+from hinjodl.sip_layout import list_sips
+
+
+set_timestamp_pattern = re.compile(r'_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}$')
+
+default_threshold = 3.5     # robust z-score, as recommended by Iglewicz and Hoaglin
+min_group_size = 20         # smaller groups are compared with all files of their type
+min_mad = 0.02              # log10 scale, about 5 %; groups of identical sizes would flag any difference
+
+
+class FileSizes:
+
+    """Sizes of the files of an archive, with the group key of each file."""
+
+    def __init__(self):
+        self.paths = []
+        self.sizes = array('q')
+        self.groups = array('l')    # index in group_names
+        self.group_ids = {}         # {'<journal or set> <role> <extension>': index}
+        self.group_names = []
+        self.group_types = []       # '<role> <extension>' of each group
+
+    def add(self, path, size, unit, name):
+
+        """Adds a file. unit is the journal or set, name the path of the file inside its SIP."""
+
+        role = 'supplement' if '/supplements/' in name else 'article'
+        extension = os.path.splitext(name)[1].lower() or '(none)'
+        group_name = f'{unit} {role} {extension}'
+        group_id = self.group_ids.get(group_name)
+        if group_id is None:
+            group_id = self.group_ids[group_name] = len(self.group_names)
+            self.group_names.append(group_name)
+            self.group_types.append(f'{role} {extension}')
+        self.paths.append(path)
+        self.sizes.append(size)
+        self.groups.append(group_id)
+
+    def __len__(self):
+        return len(self.sizes)
+
+
+def split_set_name(set_folder_name):
+
+    """Returns (set, journal) of a set folder or set package, e.g. ('HINDAWI_JPOL_2017', 'JPOL')."""
+
+    set_name = set_timestamp_pattern.sub('', set_folder_name[:-len('.tar')] if set_folder_name.endswith('.tar')
+                                         else set_folder_name)
+    parts = set_name.split('_')
+    journal = parts[1] if parts[0] == 'HINDAWI' and len(parts) > 1 else set_name
+    return set_name, journal
+
+
+def scan_sip_folder(file_sizes, sip_path, unit):
+
+    """Adds the files of a SIP folder, from its manifest or from its MASTER folder."""
+
+    sip_manifest = os.path.join(sip_path, manifest_name)
+    if os.path.isfile(sip_manifest):
+        for entry in read_manifest(sip_manifest):
+            file_sizes.add(os.path.join(sip_path, entry['path']), entry['size'], unit, entry['path'])
+        return
+
+    folders = [(os.path.join(sip_path, 'MASTER'), 'MASTER')]
+    while folders:
+        folder, relative_folder = folders.pop()
+        try:
+            entries = list(os.scandir(folder))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            relative_name = f'{relative_folder}/{entry.name}'
+            if entry.is_dir(follow_symlinks=False):
+                folders.append((entry.path, relative_name))
+            elif entry.is_file(follow_symlinks=False) \
+                    and entry.name.rsplit('.', 1)[-1] not in hashlib.algorithms_guaranteed:    # checksum sidecars
+                file_sizes.add(entry.path, entry.stat(follow_symlinks=False).st_size, unit, relative_name)
+
+
+def scan_package(file_sizes, package_path, unit):
+
+    """Adds the downloaded files of a SIP or set package, sizes come from the tar headers."""
+
+    with tarfile.open(package_path, 'r:') as package:
+        for member in package:
+            if member.isfile() and '/MASTER/' in member.name:
+                relative_name = 'MASTER/' + member.name.split('/MASTER/', 1)[1]
+                file_sizes.add(f'{package_path}:{member.name}', member.size, unit, relative_name)
+
+
+def scan_set_folder(file_sizes, set_path, unit):
+
+    """Adds the files of a set folder, from the set manifest if there is one."""
+
+    set_manifest = os.path.join(set_path, manifest_name)
+    if os.path.isfile(set_manifest):
+        for entry in read_manifest(set_manifest):
+            file_sizes.add(os.path.join(set_path, entry['path']), entry['size'], unit, entry['path'].split('/', 1)[-1])
+        return
+
+    sips, _ = list_sips(set_path)       # without links, those are duplicates of SIPs in other sets
+    for entry in sips:
+        if entry.is_dir(follow_symlinks=False):
+            scan_sip_folder(file_sizes, entry.path, unit)
+        else:
+            scan_package(file_sizes, entry.path, unit)
+
+
+def collect_file_sizes(roots, groupby='journal'):
+
+    """Returns the FileSizes of all set folders and set packages in the given folders."""
+
+    file_sizes = FileSizes()
+    for root in roots:
+        with os.scandir(root) as entries:
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                if entry.name.startswith('.'):      # staging area
+                    continue
+                set_name, journal = split_set_name(entry.name)
+                unit = set_name if groupby == 'set' else journal
+                if entry.is_dir(follow_symlinks=False):
+                    scan_set_folder(file_sizes, entry.path, unit)
+                elif entry.name.endswith('.tar') and entry.is_file(follow_symlinks=False):
+                    scan_package(file_sizes, entry.path, unit)
+    return file_sizes
+
+
+def group_medians(values, groups, group_count):
+
+    """
+    Returns the median of values per group (groups: index of the group of
+    each value, all groups non-empty). Values have to be in [0, 32).
+    """
+
+    # one plain sort of group and value packed into a float is much faster than a lexsort
+    counts = np.bincount(groups, minlength=group_count)
+    sorted_values = np.sort(groups * 32.0 + values) - np.repeat(np.arange(group_count) * 32.0, counts)
+    starts = np.cumsum(counts) - counts
+    return (sorted_values[starts + (counts - 1) // 2] + sorted_values[starts + counts // 2]) / 2
+
+
+def robust_scores(log_sizes, groups):
+
+    """
+    Returns the robust z-score of every value against its group, the median
+    of each group and the number of values per group.
+    """
+
+    group_count = groups.max() + 1 if len(groups) else 0
+    medians = group_medians(log_sizes, groups, group_count)
+    deviations = log_sizes - medians[groups]
+    mads = np.maximum(group_medians(np.abs(deviations), groups, group_count), min_mad)
+    return 0.6745 * deviations / mads[groups], medians, np.bincount(groups, minlength=group_count)
+
+
+def find_anomalies(file_sizes, threshold=default_threshold):
+
+    """
+    Returns the outliers as a list of dictionaries, ranked: empty files
+    first, then by decreasing score.
+    """
+
+    sizes = np.frombuffer(file_sizes.sizes, dtype=np.int64)
+
+    anomalies = []
+    for index in np.flatnonzero(sizes == 0):
+        anomalies.append({'finding': 'empty', 'score': float('inf'), 'index': index})
+
+    nonempty = np.flatnonzero(sizes > 0)
+    if len(nonempty):
+        log_sizes = np.log10(sizes[nonempty])
+        type_names, group_types = np.unique(np.array(file_sizes.group_types), return_inverse=True)
+        all_groups = np.frombuffer(file_sizes.groups, dtype=np.dtype(file_sizes.groups.typecode))
+        # stats need groups without gaps, there may be groups of empty files only
+        group_ids, groups = np.unique(all_groups[nonempty], return_inverse=True)
+        type_ids, types = np.unique(group_types.ravel()[all_groups[nonempty]], return_inverse=True)
+        groups, types = groups.ravel(), types.ravel()
+        group_scores, group_centers, group_counts = robust_scores(log_sizes, groups)
+        type_scores, type_centers, type_counts = robust_scores(log_sizes, types)
+
+        # small groups are compared with all files of their type
+        own_group = group_counts[groups] >= min_group_size
+        scores = np.where(own_group, group_scores, type_scores)
+
+        for position in np.flatnonzero(np.abs(scores) > threshold):
+            if own_group[position]:
+                group = file_sizes.group_names[group_ids[groups[position]]]
+                center = group_centers[groups[position]]
+                group_size = group_counts[groups[position]]
+            else:
+                group = f'(all) {type_names[type_ids[types[position]]]}'
+                center = type_centers[types[position]]
+                group_size = type_counts[types[position]]
+            anomalies.append({'finding': 'large' if scores[position] > 0 else 'small',
+                              'score': abs(float(scores[position])),
+                              'index': nonempty[position],
+                              'median': int(round(10 ** center)),
+                              'group': group,
+                              'group_size': int(group_size)})
+
+    anomalies.sort(key=lambda anomaly: -anomaly['score'])
+    for anomaly in anomalies:
+        index = anomaly.pop('index')
+        anomaly['path'] = file_sizes.paths[index]
+        anomaly['size'] = int(sizes[index])
+    return anomalies
+
+
+def write_report(anomalies, filename):
+
+    """Writes the ranked outliers to a CSV file."""
+
+    with open(filename, 'w', newline='') as csv_file:
+        csvwriter = csv.writer(csv_file)
+        csvwriter.writerow(['rank', 'finding', 'score', 'size', 'group median', 'group', 'files in group', 'path'])
+        for rank, anomaly in enumerate(anomalies, 1):
+            score = 'inf' if anomaly['finding'] == 'empty' else f'{anomaly["score"]:.1f}'
+            csvwriter.writerow([rank, anomaly['finding'], score, anomaly['size'], anomaly.get('median', ''),
+                                anomaly.get('group', ''), anomaly.get('group_size', ''), anomaly['path']])
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Find files with unusual sizes among the downloaded or ingested SIPs.')
+    parser.add_argument('roots',
+                        nargs='+',
+                        metavar='FOLDER',
+                        help='Folder with set folders or set packages, e.g. the download folder.')
+    parser.add_argument('--groupby',
+                        choices=['journal', 'set'],
+                        default='journal',
+                        help='Compare files per journal or per set, besides role and extension (default: journal).')
+    parser.add_argument('--threshold',
+                        type=float,
+                        default=default_threshold,
+                        help=f'Robust z-score above which a size is reported (default: {default_threshold}).')
+    parser.add_argument('--report',
+                        default='size_anomalies.csv',
+                        metavar='CSVFILE',
+                        help='Report file (default: size_anomalies.csv).')
+    args = parser.parse_args(argv)
+
+    start_time = time.monotonic()
+    file_sizes = collect_file_sizes(args.roots, args.groupby)
+    read_time = time.monotonic() - start_time
+    if not file_sizes:
+        print('No files found.')
+        return 0
+
+    start_time = time.monotonic()
+    anomalies = find_anomalies(file_sizes, args.threshold)
+    analysis_time = time.monotonic() - start_time
+
+    findings = {'empty': 0, 'small': 0, 'large': 0}
+    for anomaly in anomalies:
+        findings[anomaly['finding']] += 1
+    print(f'Read the sizes of {len(file_sizes)} files in {read_time:.1f} s, analyzed them in {analysis_time:.2f} s.')
+    print(f'Found {findings["empty"]} empty files, {findings["small"]} unusually small and '
+          f'{findings["large"]} unusually large ones.')
+
+    if anomalies:
+        write_report(anomalies, args.report)
+        print(f'Wrote ranked findings to {args.report}.')
+    return 1 if findings['empty'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
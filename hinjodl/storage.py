@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Where the SIPs go: a folder on the local file system or a bucket in an
+# S3-compatible object store (AWS S3, MinIO, Ceph, ...). The first line of
+# 'download_to.cfg' decides:
+#
+#   /storage/PROD/oa-journals/Hindawi/JSPEC
+#   s3://lza-ingest/oa-journals/Hindawi/JSPEC
+#
+# In the bucket, keys follow the folder layout (<set folder>/<SIP>/...). No
+# SIP is written locally first and copied afterwards. Files larger than one
+# part go up in a multipart upload while they are downloaded, the parts of
+# all files are uploaded concurrently. Nothing of a SIP is visible before it
+# is committed: the uploads are completed then, and smaller files, which wait
+# in memory until then, are put. A discarded SIP aborts its uploads.
+#
+# An object store can not make several objects visible at once, so during the
+# commit a SIP is visible in part. The commit ends with the marker object
+# '<SIP>/.complete' listing the keys of the SIP; a SIP without it is not
+# complete and has to be ignored by readers, as exists() does. If the commit
+# fails, the objects written so far are deleted again. Packages (see
+# hinjodl.packaging) are single objects, streamed into a multipart upload the
+# same way and visible all at once.
+#
+# The S3 backend needs boto3 ('pip3 install .[s3]'), imported only when a
+# bucket is configured. Credentials come from the usual places (environment
+# variables AWS_ACCESS_KEY_ID/AWS_SECRET_ACCESS_KEY, ~/.aws/credentials).
+# For MinIO and other S3-compatible stores, give the endpoint with
+# '--s3endpoint http://localhost:9000'.
+
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from shutil import rmtree
+from hinjodl.packaging import FolderSip, StagedFile
+from hinjodl.checksums import HashingFile, default_algorithms
+
+
+complete_marker = '.complete'   # last object of a committed SIP in a bucket
+
+
+class LocalStorage:
+
+    """Download folder on the local file system. SIPs are built in a staging area inside it."""
+
+    is_local = True
+    can_link = True     # duplicates can be symlinked
+
+    def __init__(self, root):
+        self.root = root
+        self.staging_root = os.path.join(root, '.staging')
+
+    def __str__(self):
+        return self.root
+
+    def join(self, *names):
+
+        """Returns the path of a set folder, SIP or file, e.g. join(set_folder_name, sip_folder_name)."""
+
+        return os.path.join(self.root, *names)
+
+    def location(self, path):
+
+        """Returns a path in a form that stays valid for later runs, e.g. for the index of seen records."""
+
+        return os.path.abspath(path)
+
+    def exists(self, path):
+        return os.path.lexists(path)
+
+    def create_folder(self, path):
+        os.mkdir(path)
+
+    def remove_empty_folder(self, path, ignore=(), onerror=None):
+
+        """Removes a folder if there is nothing in it but the names in ignore. Returns True if removed."""
+
+        if os.path.isdir(path) and set(os.listdir(path)) <= set(ignore):
+            rmtree(path, onerror=onerror)
+            return True
+        return False
+
+    def folder_sip(self, staging_path, path, algorithms=default_algorithms):
+
+        """Returns the writer of a SIP in the folder layout."""
+
+        return FolderSip(staging_path, path, algorithms)
+
+    def create_file(self, path, staging_path):
+
+        """Returns a writable file that is moved to path on commit(), e.g. for a package."""
+
+        return StagedFile(staging_path, path)
+
+    def store_file(self, local_path, path):
+
+        """Moves a finished file, e.g. a set manifest, to its place."""
+
+        if os.path.abspath(local_path) != os.path.abspath(path):
+            os.replace(local_path, path)
+
+    def close(self):
+        pass
+
+
+class MultipartUpload:
+
+    """
+    Object in a bucket that is uploaded while it is written. Full parts are
+    handed to the upload threads right away, the object becomes visible on
+    commit(). Objects smaller than a part are put with a single request then.
+    """
+
+    def __init__(self, storage, key):
+        self.storage = storage
+        self.key = key
+        self.path = storage.url(key)
+        self.part_size = storage.part_size
+        self.buffer = bytearray()
+        self.size = 0
+        self.upload_id = None
+        self.parts = []         # futures of the uploaded parts
+        self.put = None         # future of a single request upload
+        self.completed = False  # the object is visible
+        self.lock = threading.Lock()
+
+    def write(self, data):
+        with self.lock:
+            self.buffer += data
+            self.size += len(data)
+            while len(self.buffer) >= self.part_size:
+                part = bytes(self.buffer[:self.part_size])
+                del self.buffer[:self.part_size]
+                self._upload_part(part)
+        return len(data)
+
+    def tell(self):
+        return self.size
+
+    def close(self):
+        pass    # uploaded on commit()
+
+    def _upload_part(self, data):
+        if self.upload_id is None:
+            self.upload_id = self.storage.client.create_multipart_upload(Bucket=self.storage.bucket,
+                                                                          Key=self.key)['UploadId']
+        self.storage.upload_slots.acquire()     # bounds the memory of parts waiting for upload
+        self.parts.append(self.storage.executor.submit(self._send_part, len(self.parts) + 1, data))
+        # an upload has at most 10000 parts, larger ones keep big files within that
+        if len(self.parts) % 1000 == 0:
+            self.part_size *= 2
+
+    def _send_part(self, part_number, data):
+        try:
+            response = self.storage.client.upload_part(Bucket=self.storage.bucket,
+                                                       Key=self.key,
+                                                       UploadId=self.upload_id,
+                                                       PartNumber=part_number,
+                                                       Body=data)
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+        finally:
+            self.storage.upload_slots.release()
+
+    def finish(self):
+
+        """Starts the upload of what is left. complete() waits for it."""
+
+        with self.lock:
+            if self.upload_id is None:
+                self.put = self.storage.executor.submit(self.storage.client.put_object,
+                                                        Bucket=self.storage.bucket,
+                                                        Key=self.key,
+                                                        Body=bytes(self.buffer))
+            elif self.buffer:
+                self._upload_part(bytes(self.buffer))
+            self.buffer = bytearray()
+
+    def complete(self):
+
+        """Waits for all parts and makes the object visible."""
+
+        if self.put is not None:
+            self.put.result()
+            self.completed = True
+            return
+        parts = [part.result() for part in self.parts]
+        self.storage.client.complete_multipart_upload(Bucket=self.storage.bucket,
+                                                      Key=self.key,
+                                                      UploadId=self.upload_id,
+                                                      MultipartUpload={'Parts': parts})
+        self.upload_id = None
+        self.completed = True
+
+    def commit(self):
+        self.finish()
+        self.complete()
+
+    def discard(self):
+
+        """
+        Drops the object: parts already uploaded are deleted by aborting the
+        upload, an object that is already visible is deleted.
+        """
+
+        with self.lock:
+            self.buffer = bytearray()
+            upload_id, self.upload_id = self.upload_id, None
+            put, self.put = self.put, None
+        # called while cleaning up after errors; a lifecycle rule of the bucket removes leftovers of failed calls
+        try:
+            if upload_id is not None:
+                wait(self.parts)
+                self.storage.client.abort_multipart_upload(Bucket=self.storage.bucket, Key=self.key,
+                                                           UploadId=upload_id)
+            elif put is not None:
+                wait([put])
+                if put.exception() is None:
+                    self.storage.client.delete_object(Bucket=self.storage.bucket, Key=self.key)
+            elif self.completed:
+                self.storage.client.delete_object(Bucket=self.storage.bucket, Key=self.key)
+        except Exception:
+            pass
+        self.completed = False
+
+
+class ObjectSip:
+
+    """SIP as objects in a bucket, they become visible on commit (the counterpart of FolderSip)."""
+
+    can_link = False    # there are no links in object stores
+
+    def __init__(self, storage, key, algorithms=default_algorithms):
+        self.storage = storage
+        self.key = key
+        self.path = storage.url(key)
+        self.algorithms = algorithms
+        self.lock = threading.Lock()
+        self.uploads = {}   # {name: MultipartUpload}
+
+    def create(self):
+        pass
+
+    def open(self, name):
+
+        """Returns a binary file object for a file of the SIP, like FolderSip.open()."""
+
+        upload = MultipartUpload(self.storage, f'{self.key}/{name}')
+        with self.lock:
+            replaced = self.uploads.pop(name, None)
+            self.uploads[name] = upload
+        if replaced is not None:
+            replaced.discard()
+        return HashingFile(upload, self.algorithms)
+
+    def write(self, name, content):
+        with self.open(name) as file:
+            file.write(content)
+
+    def remove(self, name):
+        with self.lock:
+            upload = self.uploads.pop(name, None)
+        if upload is not None:
+            upload.discard()
+
+    def exists(self):
+
+        """Tells if the SIP was committed, see complete_marker."""
+
+        return self.storage.object_exists(f'{self.key}/{complete_marker}')
+
+    def commit(self):
+
+        """Makes the objects visible, then adds the marker. On errors, the objects written so far are deleted."""
+
+        with self.lock:
+            uploads = [self.uploads[name] for name in sorted(self.uploads)]
+            self.uploads = {}
+        marker = MultipartUpload(self.storage, f'{self.key}/{complete_marker}')
+        marker.write(''.join(f'{upload.key}\n' for upload in uploads).encode('utf-8'))
+        try:
+            for upload in uploads:
+                upload.finish()
+            for upload in uploads:
+                upload.complete()
+            marker.commit()
+        except BaseException:
+            for upload in uploads + [marker]:
+                upload.discard()
+            raise
+
+    def discard(self, onerror=None):
+        with self.lock:
+            uploads = list(self.uploads.values())
+            self.uploads = {}
+        for upload in uploads:
+            upload.discard()
+
+
+class S3Storage:
+
+    """Bucket (and key prefix) in an S3-compatible object store. Safe to share between threads."""
+
+    is_local = False
+    can_link = False
+    part_size = 8 * 1024**2     # at least 5 MiB, except for the last part
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, workers=8, staging_root='.staging'):
+
+        import boto3
+        from botocore.config import Config
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.staging_root = staging_root    # spool files of packages and set manifests
+        self.client = boto3.client('s3',
+                                   endpoint_url=endpoint_url,
+                                   config=Config(max_pool_connections=workers + 4,
+                                                 retries={'mode': 'standard'}))
+        self.client.head_bucket(Bucket=bucket)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload')
+        self.upload_slots = threading.BoundedSemaphore(2 * workers)
+
+    def __str__(self):
+        return self.url(self.prefix)
+
+    def url(self, key):
+        return f's3://{self.bucket}/{key}'
+
+    def key(self, path):
+        return path[len(f's3://{self.bucket}/'):] if path.startswith('s3://') else path
+
+    def join(self, *names):
+        return '/'.join((self.prefix,) + names if self.prefix else names)
+
+    def location(self, path):
+        return self.url(self.key(path))
+
+    def object_exists(self, key):
+
+        """Tells if there is an object with exactly this key."""
+
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as exception:
+            if exception.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def exists(self, path):
+
+        """Tells if there is an object with this key, or objects 'below' it."""
+
+        key = self.key(path)
+        if self.object_exists(key):
+            return True
+        response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=key + '/', MaxKeys=1)
+        return response.get('KeyCount', 0) > 0
+
+    def create_folder(self, path):
+        pass    # keys need no folders
+
+    def remove_empty_folder(self, path, ignore=(), onerror=None):
+        return False
+
+    def folder_sip(self, staging_path, path, algorithms=default_algorithms):
+        return ObjectSip(self, self.key(path), algorithms)
+
+    def create_file(self, path, staging_path):
+        return MultipartUpload(self, self.key(path))
+
+    def store_file(self, local_path, path):
+        self.client.upload_file(local_path, self.bucket, self.key(path))
+        os.remove(local_path)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def open_storage(destination, endpoint_url=None, workers=8):
+
+    """Returns the storage backend of a destination: a local folder or 's3://bucket/prefix'."""
+
+    if destination.startswith('s3://'):
+        bucket, _, prefix = destination[len('s3://'):].partition('/')
+        return S3Storage(bucket, prefix, endpoint_url, workers)
+    return LocalStorage(destination)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Rate limiting shared by the download workers of the downloader. With several
+# workers fetching concurrently, Hindawi would see bursts of requests that the
+# former one-after-another loop never produced. All requests (OAI PMH, article
+# pages, file downloads) take a token from a common bucket first.
+#
+# A second bucket counts bytes instead of requests and caps the bandwidth of
+# all file downloads together. Transfers take tokens chunk by chunk, and each
+# transfer only asks for its next chunk after the previous one was granted.
+# Since the bucket serves callers in the order they arrive, the bandwidth is
+# shared round robin between all running transfers: a huge supplement gets
+# no more than its share and can not starve the small PDFs. The bandwidth can
+# be changed while the downloader runs by editing a file, see RateFileWatcher.
+
+
+import os
+import threading
+import time
+
+
+class TokenBucket:
+
+    """
+    Thread-safe token bucket.
+
+    Tokens refill continuously at 'rate' per second, up to 'capacity'. Taking
+    more tokens than available puts the bucket in debt, the caller sleeps
+    until the debt would have been refilled. This keeps callers roughly in
+    the order they arrived and allows requests larger than the capacity.
+    A rate of 0 (or None) disables the limit.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.lock = threading.Lock()
+        self.set_rate(rate, capacity)
+        self.tokens = self.capacity
+        self.timestamp = time.monotonic()
+
+    def set_rate(self, rate, capacity=None):
+
+        """Changes rate (and capacity) of the bucket, also while in use."""
+
+        with self.lock:
+            self.rate = rate
+            self.capacity = capacity or max(rate or 0, 1)
+
+    def acquire(self, tokens=1):
+
+        """Blocks until the given amount of tokens is available, then takes them. Returns the seconds waited."""
+
+        with self.lock:
+            if not self.rate:
+                return 0
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class RateFileWatcher(threading.Thread):
+
+    """
+    Polls a file containing a single number and applies it as the new rate
+    of a TokenBucket, multiplied by 'scale'. Unreadable contents are reported
+    to on_change as None and otherwise ignored. Call poll() once before
+    start() to apply the file right away.
+    """
+
+    def __init__(self, filename, bucket, scale=1, interval=10, on_change=None):
+        super().__init__(name='ratefile', daemon=True)
+        self.filename = filename
+        self.bucket = bucket
+        self.scale = scale
+        self.interval = interval
+        self.on_change = on_change
+        self.mtime = None
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+    def poll(self):
+
+        """Applies the rate from the file if it changed since the last poll."""
+
+        try:
+            mtime = os.stat(self.filename).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self.mtime:
+            return
+        self.mtime = mtime
+
+        try:
+            with open(self.filename, 'r') as file:
+                rate = float(file.read().strip())
+            if rate < 0:
+                raise ValueError
+        except (OSError, ValueError):
+            rate = None
+        if rate is not None:
+            self.bucket.set_rate(rate * self.scale)
+        if self.on_change is not None:
+            self.on_change(rate)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.poll()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Time limits for the network side of the downloader.
+#
+# Without timeouts a single half-open connection hangs a worker forever. Three
+# layers take care of that:
+#   * connect and read timeouts per phase (OAI PMH, article page, file),
+#   * a total deadline per article, which also caps the read timeouts, and a
+#     minimum throughput for long transfers. Time spent waiting for our own
+#     bandwidth limit or for the large file lane extends the deadline, as
+#     does a large file, by the time it may take at the minimum throughput,
+#   * a watchdog thread that cancels articles whose worker stopped reporting
+#     progress, so the record can be re-queued and a fresh worker takes over.
+# Python threads can not be killed, so cancellation is cooperative: workers
+# call a progress function regularly, which raises once they are cancelled.
+
+
+import threading
+import time
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class TransferStalled(Exception):
+    pass
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class Deadline:
+
+    """Point in time an article has to be finished by. None or 0 seconds means no deadline. Safe to share between threads."""
+
+    def __init__(self, seconds):
+        self.expires = time.monotonic() + seconds if seconds else None
+        self.lock = threading.Lock()
+
+    def remaining(self):
+        if self.expires is None:
+            return None
+        return self.expires - time.monotonic()
+
+    def extend(self, seconds):
+
+        """Moves the deadline back, e.g. by time the article was held back by the downloader itself."""
+
+        with self.lock:
+            if self.expires is not None:
+                self.expires += seconds
+
+    def check(self):
+
+        """Raises DeadlineExceeded when the deadline has passed."""
+
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded('Article deadline exceeded.')
+
+    def timeout(self, phase_timeout):
+
+        """Returns a (connect, read) timeout for requests, read timeout capped by the deadline."""
+
+        self.check()
+        connect_timeout, read_timeout = phase_timeout
+        remaining = self.remaining()
+        if remaining is not None:
+            read_timeout = min(read_timeout, remaining)
+        return connect_timeout, read_timeout
+
+
+class ThroughputGuard:
+
+    """
+    Minimum throughput rule for a single transfer.
+
+    After a grace period the average rate of the transfer must not drop below
+    min_rate (bytes per second). Small files are done long before the grace
+    period ends, so this only ever affects large transfers. Time the transfer
+    was held back by our own bandwidth limit does not count.
+    """
+
+    def __init__(self, min_rate, grace_period):
+        self.min_rate = min_rate
+        self.grace_period = grace_period
+        self.start = time.monotonic()
+        self.throttled = 0
+
+    def update(self, received_bytes, throttled=0):
+
+        """Raises TransferStalled when the transfer is too slow."""
+
+        self.throttled += throttled
+        if not self.min_rate:
+            return
+        elapsed = time.monotonic() - self.start - self.throttled
+        if elapsed > self.grace_period and received_bytes / elapsed < self.min_rate:
+            raise TransferStalled(f'Only {received_bytes / elapsed / 1024:.1f} KiB/s after {elapsed:.0f} seconds.')
+
+
+class StallWatchdog(threading.Thread):
+
+    """
+    Cancels tasks that did not report progress for too long.
+
+    A task needs the attributes 'last_progress' (time.monotonic() of the last
+    heartbeat) and 'cancelled' (threading.Event). For every stalled task,
+    on_stall(key, task) is called from the watchdog thread after the task was
+    cancelled.
+    """
+
+    def __init__(self, stall_timeout, on_stall, interval=5):
+        super().__init__(name='watchdog', daemon=True)
+        self.stall_timeout = stall_timeout
+        self.on_stall = on_stall
+        self.interval = interval
+        self.tasks = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.pending_stalls = 0     # cancelled tasks whose on_stall() has not returned yet
+
+    def watch(self, key, task):
+        with self.lock:
+            self.tasks[key] = task
+
+    def forget(self, key):
+        with self.lock:
+            self.tasks.pop(key, None)
+
+    def stop(self):
+        self.stopped.set()
+
+    def busy(self):
+
+        """Tells if on_stall() is running or about to run for a cancelled task."""
+
+        with self.lock:
+            return self.pending_stalls > 0
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            now = time.monotonic()
+            with self.lock:
+                stalled = [(key, task) for key, task in self.tasks.items()
+                           if now - task.last_progress > self.stall_timeout]
+                for key, task in stalled:
+                    del self.tasks[key]
+                self.pending_stalls += len(stalled)
+            for key, task in stalled:
+                task.cancelled.set()
+                try:
+                    self.on_stall(key, task)
+                finally:
+                    with self.lock:
+                        self.pending_stalls -= 1
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Persistent URL lookup table for the '--urllut' option of the downloader.
+#
+# A JSON lookup table has to be parsed completely into memory every time the
+# downloader starts. For a single table covering all Hindawi journals (that is
+# hundreds of thousands of DOIs) this is a waste, since only a handful of
+# entries get looked up per set. This module keeps the mapping
+# (DOI ---> Hindawi article URL) in an indexed SQLite file instead. Opening it
+# costs next to nothing, SQLite maps the file into memory and lookups are
+# indexed point queries - in both directions.
+#
+# Existing JSON files (e.g. from 'generate_urllut.py') are imported with
+#
+#   python3 -m hinjodl.urllut_store import urllut.sqlite misy_urllut.json ...
+#
+# Entries already in the store are overwritten by newer imports. For a quick
+# check of single entries:
+#
+#   python3 -m hinjodl.urllut_store lookup urllut.sqlite https://doi.org/10.1155/...
+#   python3 -m hinjodl.urllut_store lookup urllut.sqlite --reverse https://www.hindawi.com/...
+
+
+import os
+import sys
+import argparse
+import json
+import sqlite3
+import threading
+from urllib.request import pathname2url
+
+
+# let SQLite map up to 1 GiB of the file instead of reading it via syscalls
+MMAP_SIZE = 1024**3
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS urllut (
+        doi TEXT PRIMARY KEY,
+        url TEXT NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS urllut_url ON urllut (url);
+'''
+
+
+class UrlLookupTable:
+
+    """DOI to Hindawi URL mapping, stored in an SQLite file. Safe to share between threads."""
+
+    def __init__(self, filename, writable=False):
+
+        self.lock = threading.Lock()
+        if writable:
+            self.connection = sqlite3.connect(filename, check_same_thread=False)
+            self.connection.executescript(SCHEMA)
+        else:
+            # read only, also makes sure we do not create an empty database by typo
+            if not os.path.isfile(filename):
+                raise FileNotFoundError(f'URL lookup table {filename} does not exist.')
+            uri = f'file:{pathname2url(os.path.abspath(filename))}?mode=ro'
+            self.connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+        self.connection.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+
+    def get(self, doi, default=None):
+
+        """Returns the Hindawi URL for a DOI."""
+
+        with self.lock:
+            row = self.connection.execute('SELECT url FROM urllut WHERE doi = ?', (doi,)).fetchone()
+        return row[0] if row else default
+
+    def get_doi(self, url, default=None):
+
+        """Returns the DOI for a Hindawi URL (reverse lookup)."""
+
+        with self.lock:
+            row = self.connection.execute('SELECT doi FROM urllut WHERE url = ?', (url,)).fetchone()
+        return row[0] if row else default
+
+    def __contains__(self, doi):
+        return self.get(doi) is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM urllut').fetchone()[0]
+
+    def update(self, mapping):
+
+        """Inserts or replaces entries from a dictionary {DOI: URL}."""
+
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO urllut (doi, url) VALUES (?, ?)',
+                                        mapping.items())
+
+    def close(self):
+        self.connection.close()
+
+
+def import_json_files(store_file, json_files):
+
+    """Imports JSON lookup tables into the store, creating it if necessary."""
+
+    store = UrlLookupTable(store_file, writable=True)
+    for json_file in json_files:
+        with open(json_file, 'r') as file:
+            mapping = json.load(file)
+        store.update(mapping)
+        print(f'Imported {len(mapping)} entries from {json_file}.')
+    print(f'{store_file} now contains {len(store)} entries.')
+    store.close()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Manage the SQLite URL lookup table used by --urllut.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help='Import JSON lookup tables.')
+    import_parser.add_argument('store', metavar='STOREFILE')
+    import_parser.add_argument('jsonfiles', nargs='+', metavar='JSONFILE')
+
+    lookup_parser = subparsers.add_parser('lookup', help='Look up a DOI (or a URL with --reverse).')
+    lookup_parser.add_argument('store', metavar='STOREFILE')
+    lookup_parser.add_argument('key', metavar='DOI or URL')
+    lookup_parser.add_argument('--reverse',
+                               action='store_true',
+                               default=False,
+                               help='Look up the DOI for a Hindawi URL.')
+
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        import_json_files(args.store, args.jsonfiles)
+    else:
+        store = UrlLookupTable(args.store)
+        if args.reverse:
+            result = store.get_doi(args.key)
+        else:
+            result = store.get(args.key)
+        if result is None:
+            print(f'{args.key} not found.')
+            sys.exit(1)
+        print(result)
+
+
+if __name__ == '__main__':
+    main()
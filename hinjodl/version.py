@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Version of the downloader: the date of the latest commit. It ends up in
+# every harvest.xml, so it has to be right. An installed package carries it
+# in '_version.py', written at build time by setup.py. Only when running from
+# a git checkout without that file, git is asked.
+
+
+import os
+import subprocess
+
+
+def get_version():
+
+    """Returns the version string, None if it can not be determined."""
+
+    try:
+        from hinjodl._version import version
+        return version
+    except ImportError:
+        pass
+
+    try:
+        git_query = subprocess.run(['git', 'log', '-1', '--format=%cd'],
+                                   cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    return git_query.stdout.decode('utf-8').rstrip() or None
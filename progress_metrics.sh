@@ -14,7 +14,7 @@ download_folder=/enter/folder/here
 ingested_folder=/enter/folder/there
 total_ies=41168
 
-todo=$(find $download_folder -type d -name "MASTER" | wc -l)
+todo=$(find $download_folder -type d -name "MASTER" -not -path "*/.staging/*" | wc -l)
 done=$(find $ingested_folder -type d -name "MASTER" | wc -l)
 sum=$(expr $todo + $done)
 remaining=$(expr $total_ies - $sum)
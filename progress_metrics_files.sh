@@ -6,14 +6,14 @@
 # Quick and dirty mod of the IE count script. Now counts files.
 #
 # The script counts actual article files and supplementary materials if they
-# exist. It ignores MD5 sidecar files or XML metadata files produced by the
+# exist. It ignores checksum sidecar files or XML metadata files produced by the
 # downloader.
 
 download_folder=/enter/folder/here
 ingested_folder=/enter/folder/there
 
-todo=$(find $download_folder -type f -path "*MASTER*" ! -name "*.md5" | wc -l)
-done=$(find $ingested_folder -type f -path "*MASTER*" ! -name "*.md5" | wc -l)
+todo=$(find $download_folder -type f -path "*MASTER*" ! -name "*.md5" ! -name "*.sha*" ! -path "*/.staging/*" | wc -l)
+done=$(find $ingested_folder -type f -path "*MASTER*" ! -name "*.md5" ! -name "*.sha*" | wc -l)
 sum=$(expr $todo + $done)
 
 printf "TOTAL (SUM), TO BE PROCESSED, PROCESSED\n"
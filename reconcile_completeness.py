@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Completeness check: Hindawi website vs. OAI PMH interface.
+#
+# This is the unattended big brother of 'count_article_pages.py'. Instead of
+# counting one volume after another and comparing the resulting CSV with the
+# downloader's '<timestamp>_counted_records.csv' by hand, it
+#
+#   1. gets the subsets (volumes) of the given journals via ListSets,
+#   2. crawls the volume navigation pages of the website concurrently,
+#   3. lists the record identifiers of the matching OAI PMH subsets,
+#   4. joins both sources per volume.
+#
+# Articles are matched by DOI. OAI identifiers contain the DOI
+# (oai:hindawi.com:10.1155/2016/1234567), article URLs usually end with the
+# numeric part of it (/journals/jpol/2016/1234567/). For older articles, whose
+# DOIs do not follow that scheme, a URL lookup table (see 'hinjodl/urllut_store.py')
+# can be passed with '--urllut' and is used for reverse lookups (URL ---> DOI).
+#
+# Usage:
+#
+#   python3 reconcile_completeness.py jpol HINDAWI.IJMMS --workers 6
+#   python3 reconcile_completeness.py jpol --volumes 2015 2016
+#
+# Output:
+#   <timestamp>_reconciliation.csv      counts per volume, mismatches flagged
+#   <timestamp>_missing_from_oai.txt    article URLs without OAI record, and
+#                                       OAI records without article URL,
+#                                       per mismatching volume
+#
+# Requests to the website are paced globally ('--delay'). Instead of the fixed
+# sleeps of 'count_article_pages.py', a 403 or 429 response slows down all
+# workers and the same page is requested again later.
+
+
+import argparse
+import csv
+import datetime
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from bs4 import BeautifulSoup
+from sickle import Sickle
+from sickle.oaiexceptions import NoRecordsMatch
+from hinjodl.urllut_store import UrlLookupTable
+
+
+hindawi = 'https://www.hindawi.com'
+url_base = 'https://www.hindawi.com/journals'
+url_volume_component = 'contents/year'
+url_page_component = 'page'
+oai_base_url = 'https://www.hindawi.com/oai-pmh/oai.aspx'
+doi_prefix = '10.1155/'
+
+# human readable timestamp used in output file names
+now = datetime.datetime.today()
+timestamp = now.strftime('%Y-%m-%d_%H-%M-%S')
+
+
+class RequestPacer:
+
+    """Keeps a minimum delay between website requests of all threads."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.next_request = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_request)
+            self.next_request = start + self.delay
+        time.sleep(start - now)
+
+    def back_off(self, seconds):
+
+        """Pauses all threads, e.g. after being told to slow down (403, 429)."""
+
+        with self.lock:
+            self.next_request = max(self.next_request, time.monotonic() + seconds)
+
+
+def construct_url(*components):
+
+    """Concetenate strings to URL."""
+
+    separator = '/'
+    url = separator.join(components)
+    return url
+
+
+def get_page(url):
+
+    """Requests a website page, retries when the server pushes back."""
+
+    for attempt in range(1, max_attempts + 1):
+        pacer.wait()
+        try:
+            page = requests.get(url, timeout=(10, 60))
+        except requests.exceptions.RequestException as exception:
+            print(f'WARNING: {url} fails with {exception.__class__.__name__}.')
+            pacer.back_off(10 * attempt)
+            continue
+        if page.ok:
+            return page
+        print(f'WARNING: {page.url} fails with HTTP error {page.status_code}.')
+        if page.status_code in (403, 429, 500, 502, 503, 504):
+            pacer.back_off(60 * attempt)
+        else:
+            return None
+    print(f'ERROR: Giving up on {url}.')
+    return None
+
+
+def scrape_article_urls(page_content, journal, volume):
+
+    """Squeezes full article URLs from navigational page."""
+
+    article_url_pattern = re.compile(rf'/journals/{journal}/{volume}/\d+/$')
+    article_url_elements = page_content.find_all('a', href=article_url_pattern)
+
+    return {hindawi + element.get('href') for element in article_url_elements}
+
+
+def crawl_volume(journal, volume):
+
+    """Returns all article URLs of a volume, None if the navigation could not be crawled."""
+
+    article_urls = set()
+    url_page_number = 1
+
+    while True:
+        target_url = construct_url(url_base,
+                                   journal,
+                                   url_volume_component,
+                                   volume,
+                                   url_page_component,
+                                   str(url_page_number))
+        navi_page = get_page(target_url)
+        if navi_page is None:
+            return None
+
+        current_article_urls = scrape_article_urls(BeautifulSoup(navi_page.text, 'lxml'), journal, volume)
+        if not current_article_urls:
+            break
+        article_urls.update(current_article_urls)
+        url_page_number += 1
+
+    print(f'Website: {journal} {volume} has {len(article_urls)} articles.')
+    return article_urls
+
+
+def list_set_dois(oai_set):
+
+    """Returns the DOIs contained in the identifiers of an OAI PMH set."""
+
+    try:
+        headers = sickle.ListIdentifiers(metadataPrefix='oai_dc', set=oai_set)
+        dois = {header.identifier.split(':', 2)[2].lower() for header in headers}
+    except NoRecordsMatch:
+        dois = set()
+
+    print(f'OAI PMH: {oai_set} has {len(dois)} records.')
+    return dois
+
+
+def url_to_doi(article_url, volume):
+
+    """Derives the DOI of an article URL, preferably from the URL lookup table."""
+
+    if url_lookup_table is not None:
+        doi = url_lookup_table.get_doi(article_url)
+        if doi:
+            return doi.partition('doi.org/')[-1].lower()
+
+    article_number = article_url.rstrip('/').split('/')[-1]
+    return f'{doi_prefix}{volume}/{article_number}'
+
+
+def get_journal_volumes(set_catalog, journal_set):
+
+    """Maps website volumes to OAI PMH subsets of a journal, e.g. {'2016': 'HINDAWI.JPOL:2016'}."""
+
+    volumes = {}
+    for setspec in set_catalog:
+        if ':' in setspec and setspec.split(':')[0] == journal_set:
+            volumes[setspec.split(':')[1]] = setspec
+    return volumes
+
+
+def reconcile_volume(journal, volume, oai_set):
+
+    """Crawls website and OAI PMH for one volume, returns a result dictionary."""
+
+    result = {'journal': journal, 'volume': volume, 'set': oai_set}
+
+    article_urls = crawl_volume(journal, volume)
+    oai_dois = list_set_dois(oai_set) if oai_set else set()
+
+    if article_urls is None:
+        result.update(website=None, oai=len(oai_dois), status='WEBSITE FAILED',
+                      missing_from_oai=[], missing_from_website=[])
+        return result
+
+    website_dois = {url_to_doi(url, volume): url for url in article_urls}
+
+    missing_from_oai = sorted(website_dois[doi] for doi in website_dois.keys() - oai_dois)
+    missing_from_website = sorted(oai_dois - website_dois.keys())
+
+    if not oai_set:
+        status = 'NO OAI SET'
+    elif missing_from_oai or missing_from_website:
+        status = 'MISMATCH'
+    else:
+        status = 'OK'
+
+    result.update(website=len(article_urls), oai=len(oai_dois), status=status,
+                  missing_from_oai=missing_from_oai, missing_from_website=missing_from_website)
+    return result
+
+
+def write_reports(results):
+
+    """Writes the joined counts as CSV and the mismatching articles as text file."""
+
+    with open(f'{timestamp}_reconciliation.csv', 'w') as csv_file:
+        csvwriter = csv.writer(csv_file)
+        csvwriter.writerow(['JOURNAL', 'VOLUME', 'SET', 'WEBSITE', 'OAI', 'DIFFERENCE', 'STATUS'])
+        for result in results:
+            difference = None
+            if result['website'] is not None:
+                difference = result['website'] - result['oai']
+            csvwriter.writerow([result['journal'], result['volume'], result['set'],
+                                result['website'], result['oai'], difference, result['status']])
+
+    mismatches = [result for result in results if result['status'] != 'OK']
+    with open(f'{timestamp}_missing_from_oai.txt', 'w') as report_file:
+        for result in mismatches:
+            report_file.write(f"=== {result['journal']} {result['volume']} ({result['set']}): {result['status']}\n")
+            if result['missing_from_oai']:
+                report_file.write('Article URLs without OAI record:\n')
+                for url in result['missing_from_oai']:
+                    report_file.write(f'{url}\n')
+            if result['missing_from_website']:
+                report_file.write('OAI records without article URL (DOI):\n')
+                for doi in result['missing_from_website']:
+                    report_file.write(f'{doi}\n')
+            report_file.write('\n')
+
+    print(f'{len(mismatches)} of {len(results)} volumes do not match.')
+
+
+parser = argparse.ArgumentParser(description='Compare article counts of the Hindawi website with OAI PMH.')
+parser.add_argument('journals',
+                    nargs='+',
+                    metavar='JOURNAL',
+                    help='Journal handle as used in URLs (e.g. jpol) or OAI PMH set (e.g. HINDAWI.JPOL).')
+parser.add_argument('--volumes',
+                    nargs='+',
+                    metavar='VOLUME',
+                    help='Only check these volumes. Default: all subsets of the journal.')
+parser.add_argument('--workers',
+                    type=int,
+                    default=4,
+                    metavar='N',
+                    help='Number of volumes crawled concurrently (default: 4).')
+parser.add_argument('--delay',
+                    type=float,
+                    default=1.0,
+                    metavar='SECONDS',
+                    help='Minimum delay between two website requests of all workers (default: 1.0).')
+parser.add_argument('--urllut',
+                    metavar='STOREFILE',
+                    help='URL lookup table (SQLite) for articles whose URL does not match the DOI.')
+
+cl_args = parser.parse_args()
+
+max_attempts = 4
+pacer = RequestPacer(cl_args.delay)
+sickle = Sickle(oai_base_url, timeout=(10, 120))
+url_lookup_table = UrlLookupTable(cl_args.urllut) if cl_args.urllut else None
+
+print('Retrieving set catalog.')
+set_catalog = [item.setSpec for item in sickle.ListSets()]
+
+tasks = []
+for journal in cl_args.journals:
+    journal = journal.split(':')[0]
+    if journal.upper().startswith('HINDAWI.'):
+        journal = journal.split('.', 1)[1]
+    journal = journal.lower()
+    journal_volumes = get_journal_volumes(set_catalog, f'HINDAWI.{journal.upper()}')
+    volumes = cl_args.volumes or sorted(journal_volumes)
+    if not volumes:
+        print(f'WARNING: No subsets found for journal {journal}.')
+    for volume in volumes:
+        tasks.append((journal, volume, journal_volumes.get(volume)))
+
+print(f'Reconciling {len(tasks)} volumes with {cl_args.workers} workers.')
+
+with ThreadPoolExecutor(max_workers=cl_args.workers) as executor:
+    results = list(executor.map(lambda task: reconcile_volume(*task), tasks))
+
+write_reports(results)
+print('Done.')
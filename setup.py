@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+# Copyright and licensing information given in the main script
+# 'hindawi-downloader.py' apply.
+
+# Packaging of the downloader. The version of the downloader is the date of
+# the latest commit. It is asked from git once, at build time, and written
+# into the package as 'hinjodl/_version.py', so the installed downloader
+# does not need git (or a checkout) to know its version. A source
+# distribution carries that file, too: built from an sdist, where there is
+# no git, the version is read from it.
+
+
+import os
+import datetime
+import subprocess
+from setuptools import setup
+from setuptools.command.build_py import build_py
+from setuptools.command.sdist import sdist
+
+
+version_file_name = os.path.join('hinjodl', '_version.py')
+
+
+def git_commit_date(date_format):
+
+    """Returns the date of the latest commit in the given git log format, None without git."""
+
+    try:
+        git_query = subprocess.run(['git', 'log', '-1', f'--format={date_format}'],
+                                   cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    return git_query.stdout.decode('utf-8').rstrip() or None
+
+
+def read_version_file():
+
+    """Returns the contents of an existing version file as {name: value}, None without one (e.g. outside an sdist)."""
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), version_file_name)
+    if not os.path.isfile(path):
+        return None
+    contents = {}
+    with open(path, 'r') as version_file:
+        exec(version_file.read(), contents)
+    return contents
+
+
+def commit_version():
+
+    """Returns the version string and the commit time (Unix time) from git, or from an sdist's version file."""
+
+    version = git_commit_date('%cd')
+    commit_time = git_commit_date('%ct')
+    if version is not None and commit_time is not None:
+        return version, int(commit_time)
+    contents = read_version_file()
+    if contents is not None and 'commit_time' in contents:
+        return contents['version'], contents['commit_time']
+    return None, None
+
+
+def package_version():
+
+    """Commit date as PEP 440 version, e.g. 2021.10.5."""
+
+    version, commit_time = commit_version()
+    if commit_time is None:
+        return '0'
+    commit_date = datetime.datetime.fromtimestamp(commit_time, tz=datetime.timezone.utc)
+    return f'{commit_date.year}.{commit_date.month}.{commit_date.day}'
+
+
+def write_version_file(path):
+
+    """Writes the version of the downloader, as seen by hinjodl.version, to the given file."""
+
+    version, commit_time = commit_version()
+    if version is None:
+        raise RuntimeError('Can not determine the version of the downloader. Build from a git checkout or an sdist.')
+    if os.path.exists(path):
+        os.remove(path)         # may be a hard link to the source file (sdist)
+    with open(path, 'w') as version_file:
+        version_file.write('# written by setup.py, see hinjodl/version.py\n')
+        version_file.write(f'version = {version!r}\n')
+        version_file.write(f'commit_time = {commit_time!r}\n')
+
+
+class build_py_with_version(build_py):
+
+    """Writes the version of the downloader into the built package."""
+
+    def run(self):
+        super().run()
+        write_version_file(os.path.join(self.build_lib, version_file_name))
+
+
+class sdist_with_version(sdist):
+
+    """Writes the version of the downloader into the source distribution."""
+
+    def make_release_tree(self, base_dir, files):
+        super().make_release_tree(base_dir, files)
+        write_version_file(os.path.join(base_dir, version_file_name))
+
+
+with open('requirements.txt', 'r') as requirements_file:
+    requirements = [line.strip() for line in requirements_file if line.strip()]
+
+
+setup(name='hinjodl',
+      version=package_version(),
+      description='TIB-LZA Journal Downloader Hindawi: downloads Hindawi articles per OAI-PMH set as SIPs.',
+      license='Apache License 2.0',
+      packages=['hinjodl'],
+      python_requires='>=3.7',
+      install_requires=requirements,
+      extras_require={'analysis': ['numpy'],      # hinjodl.size_anomalies
+                      's3': ['boto3']},           # hinjodl.storage
+      entry_points={'console_scripts': ['hinjodl = hinjodl.cli:main']},
+      cmdclass={'build_py': build_py_with_version,
+                'sdist': sdist_with_version})